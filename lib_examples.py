@@ -3,9 +3,10 @@
 # Example invocations demonstrating lib/API interface
 #
 
+import asyncio
 import sys
 
-from src.marco.marco import parse_args, enumerate_with_args
+from src.marco.marco import parse_args, enumerate_with_args, enumerate_with_args_async
 
 
 def example1():
@@ -43,9 +44,38 @@ def example2():
     print(results)
 
 
+def example3():
+    # Example 3:
+    #  Asynchronous usage with asyncio, doing other work while waiting for results.
+    print("Example 3")
+
+    args_list = ['tests/c10.cnf']
+    args_list.extend(sys.argv[1:])
+    args = parse_args(args_list)
+
+    async def count_results():
+        counts = {'U': 0, 'S': 0}
+        async for result in enumerate_with_args_async(args):
+            counts[result[0]] += 1
+        return counts
+
+    async def run():
+        task = asyncio.ensure_future(count_results())
+        # the event loop is never blocked waiting for results, so other work can go on
+        ticks = 0
+        while not task.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        print("(event loop ran %d times while enumerating)" % ticks)
+        return task.result()
+
+    print(asyncio.run(run()))
+
+
 def main():
     example1()
     example2()
+    example3()
 
 
 if __name__ == '__main__':
@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 
-from src.marco.marco import parse_args, enumerate_with_args
+from src.marco.marco import parse_args, enumerate_with_args, connect_worker
 
 
 def main():
     args = parse_args()
+    if args.connect:
+        connect_worker(args)
+        return
     for result in enumerate_with_args(args, print_results=True):
         print(result)
 
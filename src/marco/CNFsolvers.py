@@ -1,18 +1,19 @@
 import atexit
-import bisect
 import collections
-import gzip
 import os
 import re
 import subprocess
-import tempfile
 
+from . import dimacs
 from . import utils
 from ..pyminisolvers import minisolvers
 
 
 class MinisatSubsetSolver(object):
-    def __init__(self, filename, rand_seed=None, n_only=False, store_dimacs=False):
+    # keep the clauses indexed in the solver library for model rotation in shrink()?
+    rotation = True
+
+    def __init__(self, filename, rand_seed=None, n_only=False, store_dimacs=False, clausedb=None):
         self.s = minisolvers.MinisatSubsetSolver()
 
         # Initialize random seed and randomize variable activity if seed is given
@@ -22,94 +23,46 @@ class MinisatSubsetSolver(object):
 
         self.n_only = n_only
 
+        # keep the parsed instance (self.clausedb) after loading it into the solver?
         self.store_dimacs = store_dimacs
-        if self.store_dimacs:
-            self.dimacs = []
-            self.groups = collections.defaultdict(list)
-        self.read_dimacs(filename)
+        if clausedb is None:
+            self.read_dimacs(filename)
+        else:
+            # already parsed (e.g., shared by the parent process)
+            self.load_clausedb(clausedb)
         self._msolver = None
 
     def set_msolver(self, msolver):
         self._msolver = msolver
 
-    def parse_dimacs(self, f):
-        i = 0
-        for line in f:
-            if line.startswith(b'p'):
-                tokens = line.split()
-                gcnf_in = (tokens[1] == b"gcnf")
-                self.nvars = int(tokens[2])
-                self.nclauses = int(tokens[3])
-
-                # self.n = number of soft constraints
-                if gcnf_in:
-                    self.n = int(tokens[4])
-                else:
-                    self.n = self.nclauses
-
-                if self.n_only:
-                    # We're only here to parse the number of constraints.  Bail now.
-                    return
-
-                self.s.set_varcounts(self.nvars, self.n)
-
-                # let instance variables do whatever...
-                self.s.new_vars(self.nvars)
-                # but default relaxation variables to try to *enable*
-                # clauses (to find larger sat subsets and/or hit unsat
-                # sooner)
-                self.s.new_vars(self.n, True)
+    def load_clausedb(self, db):
+        self.nvars = db.nvars
+        self.nclauses = db.nclauses
+        self.n = db.n  # number of soft constraints
 
-                continue
+        if self.n_only:
+            # We're only here to get the number of constraints.  Bail now.
+            return
 
-            if line.startswith(b'c'):
-                continue
+        self.s.set_varcounts(self.nvars, self.n)
 
-            line = line.strip()
-            if line == b'':
-                continue
+        # let instance variables do whatever...
+        self.s.new_vars(self.nvars)
+        # but default relaxation variables to try to *enable*
+        # clauses (to find larger sat subsets and/or hit unsat
+        # sooner)
+        self.s.new_vars(self.n, True)
 
-            # anything else is a clause
-            assert self.n > 0
-            vals = line.split()
-            assert vals[-1] == b'0'
+        # hard clauses are in group 0, soft constraint i is group i+1
+        self.s.add_clauses_bulk(db.lits, db.groups)
+        if self.rotation:
+            self.s.set_rotation_clauses(db.lits, db.groups)
 
-            if gcnf_in:
-                groupid = int(vals[0][1:-1])  # "parse" the '{x}' group ID
-                assert 0 <= groupid <= self.n
-                clause = [int(x) for x in vals[1:-1]]
-            else:
-                groupid = i+1
-                clause = [int(x) for x in vals[:-1]]
-
-            if groupid == 0:
-                # add as a hard clause
-                self.s.add_clause(clause)
-            else:
-                self.s.add_clause_instrumented(clause, groupid-1)
-
-            if self.store_dimacs:
-                if gcnf_in:
-                    # need to reform clause without '{x}' group index
-                    self.dimacs.append(b" ".join(str(x).encode() for x in clause) + b" 0\n")
-                    self.groups[groupid].append(i)
-                else:
-                    self.dimacs.append(line + b"\n")
-                    self.groups[groupid] = [i]
-
-            i += 1
-
-        assert i == self.nclauses
+        if self.store_dimacs:
+            self.clausedb = db
 
     def read_dimacs(self, filename):
-        if filename.endswith('.gz'):
-            # use gzip to decompress
-            with gzip.open(filename, 'rb') as gz_f:
-                self.parse_dimacs(gz_f)
-        else:
-            # assume plain .cnf and pass through the file object
-            with open(filename, 'rb') as f:
-                self.parse_dimacs(f)
+        self.load_clausedb(dimacs.read_dimacs(filename, n_only=self.n_only))
 
     def check_subset(self, seed, improve_seed=False):
         is_sat = self.s.solve_subset([i-1 for i in seed])
@@ -126,19 +79,12 @@ class MinisatSubsetSolver(object):
         return set(range(1, self.n+1)).difference(aset)
 
     def shrink(self, seed):
-        hard = self._msolver.implies()
-        current = set(seed)
-        for i in seed:
-            if i not in current or i in hard:
-                # May have been "also-removed"
-                continue
-            current.remove(i)
-            if not self.check_subset(current):
-                # Remove any also-removed constraints
-                current = set(self.s.unsat_core(offset=1))  # helps a bit
-            else:
-                current.add(i)
-        return current
+        # deletion-based, with clause-set refinement and model rotation, done
+        # natively in the solver library (which keeps the instance loaded)
+        # (only constraints: the Map solver may imply its own auxiliary
+        # variables, e.g., MinicardMapSolver's bound variables)
+        hard = [x-1 for x in self._msolver.implies() if 0 < x <= self.n]
+        return self.s.shrink_subset([i-1 for i in seed], hard, offset=1)
 
     def to_c_lits(self, seed):
         # this is slow...
@@ -154,79 +100,131 @@ class MinisatSubsetSolver(object):
         return ret
 
     def grow(self, seed):
-        current = seed
-
+        #current = seed
         #while self.check_above(current):
         #    current = self.s.sat_subset()
         #return current
 
         # a bit slower at times, much faster others...
-        for x in self.complement(current):
-            # skip any included by sat_subset()
-            # assumes seed is always sorted
-            i = bisect.bisect_left(current, x)
-            if i != len(current) and current[i] == x:
-                continue
-
-            current.append(x)
-            if self.check_subset(current):
-                # Add any also-satisfied constraint
-                current = self.s.sat_subset(offset=1)
-            else:
-                current.pop()
-
-        return current
+        # (adds constraints one at a time, plus any also-satisfied by each model,
+        #  done natively in the solver library)
+        return self.s.grow_subset([i-1 for i in seed], offset=1)
+
+
+class GroupBlockCache(object):
+    """Pre-rendered GCNF text for individual groups of clauses.
+
+    A group's block is all of its clauses, each prefixed with its group ID
+    (either its own index or {0} when it is written as a hard group).  Blocks
+    are rendered on first use and kept up to a total of max_bytes, after which
+    the least recently used blocks are evicted.
+    """
+    def __init__(self, dimacs, groups, max_bytes):
+        self.dimacs = dimacs
+        self.groups = groups
+        self.max_bytes = max_bytes
+        self._blocks = collections.OrderedDict()  # key: group index (negated for hard blocks)
+        self._size = 0
+
+    def get(self, group, hard=False):
+        key = -group if hard else group
+        block = self._blocks.get(key)
+        if block is not None:
+            self._blocks.move_to_end(key)
+            return block
+
+        prefix = b"{0} " if hard else b"{%d} " % group
+        block = b"".join([prefix + self.dimacs[j] for j in self.groups[group]])
+        self._blocks[key] = block
+        self._size += len(block)
+        while self._size > self.max_bytes:
+            _, evicted = self._blocks.popitem(last=False)
+            self._size -= len(evicted)
+        return block
 
 
 class MUSerSubsetSolver(MinisatSubsetSolver):
-    def __init__(self, filename, rand_seed=None, n_only=False):
-        MinisatSubsetSolver.__init__(self, filename, rand_seed, n_only, store_dimacs=True)
+    # memory cap for each solver's cache of rendered GCNF groups
+    cache_bytes = 64 * 1024 * 1024
+    # MUSer2 does its own model rotation
+    rotation = False
+
+    def __init__(self, filename, rand_seed=None, n_only=False, clausedb=None):
+        MinisatSubsetSolver.__init__(self, filename, rand_seed, n_only, store_dimacs=True, clausedb=clausedb)
         self.core_pattern = re.compile(r'^v [\d ]+$', re.MULTILINE)
 
         binary = 'muser2-para'
         self.muser_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), binary)
         utils.check_executable("MUSer2", self.muser_path)
 
-        self._proc = None  # track the MUSer process
+        self._dontcare = None  # cached "Don't care" group for gcnf_bytes()
+        if not n_only:
+            self.dimacs = self.clausedb.dimacs_lines()
+            self.groups = self.clausedb.group_clauses()
+            self._blocks = GroupBlockCache(self.dimacs, self.groups, self.cache_bytes)
+        self._stats = None
+        self._proc = None   # track the running MUSer process
+        self._spare = None  # a MUSer process started in advance, waiting for its input
         atexit.register(self.cleanup)
 
-    # kill MUSer process if still running when we exit (e.g. due to a timeout)
+    def set_stats(self, stats):
+        self._stats = stats
+
+    # kill MUSer processes if still running when we exit (e.g. due to a timeout)
     def cleanup(self):
         if self._proc:
             self._proc.kill()
-
-    # write CNF output for MUSer2
-    def write_CNF(self, cnffile, seed, hard):
-        # Write CNF (grouped, with hard clauses, if any, in the 0 / Don't-care group)
-        header = "p gcnf %d %d %d\n" % (self.nvars, len(seed), len(seed))
-        cnffile.write(header.encode())
-
-        # Note: not writing newlines because dimacs[j] already contains a newline
-
-        # existing "Don't care" group
-        for j in self.groups[0]:
-            cnffile.write(b"{0} ")  # {0} = "Don't care" group
-            cnffile.write(self.dimacs[j])
+        if self._spare:
+            self._spare.kill()
+
+    # Start a MUSer process that reads its instance from stdin.  It waits on
+    # the pipe until the next shrink() needs it, so process startup happens
+    # in the background rather than in the critical path of every shrink.
+    # This only hides startup: MUSer2 handles one instance and exits, so
+    # every shrink still sends and re-parses the full GCNF, and a solver that
+    # has shrunk once keeps one idle MUSer process until it exits.
+    def spawn_spare(self):
+        args = [self.muser_path, '-comp', '-grp', '-v', '-1', '/dev/stdin']
+        self._spare = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # build the GCNF instance for MUSer2 as a single bytes object
+    def gcnf_bytes(self, seed, hard):
+        # CNF is grouped, with hard clauses, if any, in the 0 / Don't-care group.
+        # Each soft group keeps its own index as its group ID (MUSer2 accepts
+        # sparse IDs), so every group's text is the same in every instance,
+        # and it can be rendered once and cached.
+        parts = [b"p gcnf %d %d %d\n" % (self.nvars, len(seed), self.n)]
+
+        # existing "Don't care" group (the same for every call)
+        if self._dontcare is None:
+            self._dontcare = b"".join([b"{0} " + self.dimacs[j] for j in self.groups[0]])
+        parts.append(self._dontcare)
+
+        get_block = self._blocks.get
         # also include hard clauses in "Don't care" group
         for i in hard:
-            for j in self.groups[i]:
-                cnffile.write(b"{0} ")
-                cnffile.write(self.dimacs[j])
+            parts.append(get_block(i, hard=True))
 
-        for g, i in enumerate(seed):
+        hard = set(hard)
+        for i in seed:
             if i in hard:
                 # skip hard clauses
                 continue
-            for j in self.groups[i]:
-                cnffile.write(("{%d} " % (g+1)).encode())
-                cnffile.write(self.dimacs[j])
+            parts.append(get_block(i))
+
+        # join() sizes and fills one buffer for the whole instance
+        return b"".join(parts)
 
+    # write CNF output for MUSer2
+    def write_CNF(self, cnffile, seed, hard):
+        cnffile.write(self.gcnf_bytes(seed, hard))
         cnffile.flush()
 
     # override shrink method to use MUSer2
     # NOTE: seed must be indexed (i.e., not a set)
     def shrink(self, seed):
-        hard = [x for x in self._msolver.implies() if x > 0]
+        # (only constraints, as in MinisatSubsetSolver.shrink())
+        hard = [x for x in self._msolver.implies() if 0 < x <= self.n]
         # In parallel mode, this seed may be explored by the time
         # we get here.  If it is, the hard constraints may include
         # constraints *outside* of the current seed, which would invalidate
@@ -239,24 +237,39 @@ class MUSerSubsetSolver(MinisatSubsetSolver):
         if len(seed) == len(hard):
             return seed
 
-        # Open tmpfile
-        with tempfile.NamedTemporaryFile('wb') as cnf:
-            self.write_CNF(cnf, seed, hard)
-            args = [self.muser_path, '-comp', '-grp', '-v', '-1']
-            args += [cnf.name]
+        if self._stats is not None:
+            self._stats.start_time('muser')
+
+        instance = self.gcnf_bytes(seed, hard)
+
+        # Hand the instance to the waiting MUSer process (started now, for
+        # the first shrink), and start its replacement
+        if self._spare is None:
+            self.spawn_spare()
+        self._proc = self._spare
+        self.spawn_spare()
+
+        # Run MUSer
+        out, err = self._proc.communicate(instance)
+        killed = self._proc.returncode < 0
+        self._proc = None  # clear it when we're done (so cleanup won't try to kill it)
+
+        if self._stats is not None:
+            self._stats.end_time('muser')
 
-            # Run MUSer
-            self._proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            out, err = self._proc.communicate()
-            self._proc = None  # clear it when we're done (so cleanup won't try to kill it)
+        if killed:
+            # killed by cleanup() as we exit, while this enumerator was still
+            # running (as a thread: see --backend threads); give up on this seed
+            return None
 
-            out = out.decode()
+        out = out.decode()
 
         # Parse result, return the core
         matchline = re.search(self.core_pattern, out).group(0)
         # pMUSer outputs 0 groups as part of MUSes, so we'll just filter it out to prevent the
         # duplicate clauses in MUSes
-        ret = [seed[int(x)-1] for x in matchline.split()[1:-1] if int(x) > 0]
+        # (group IDs are the constraints' own indexes)
+        ret = [int(x) for x in matchline.split()[1:-1] if int(x) > 0]
 
         # Add back in hard clauses
         ret.extend(hard)
@@ -267,8 +280,8 @@ class MUSerSubsetSolver(MinisatSubsetSolver):
 
 
 class ImprovedImpliesSubsetSolver(MinisatSubsetSolver):
-    def __init__(self, filename, rand_seed=None, n_only=False, store_dimacs=False):
-        MinisatSubsetSolver.__init__(self, filename, rand_seed, n_only, store_dimacs)
+    def __init__(self, filename, rand_seed=None, n_only=False, store_dimacs=False, clausedb=None):
+        MinisatSubsetSolver.__init__(self, filename, rand_seed, n_only, store_dimacs, clausedb)
         self._known_MSS = 0
         self._known_MUS = 0
 
@@ -279,49 +292,26 @@ class ImprovedImpliesSubsetSolver(MinisatSubsetSolver):
         self._known_MUS += 1
 
     def shrink(self, seed):
-        current = set(seed)
-
         if self._known_MSS > 0:
-            implications = self._msolver.implies(-x for x in self.complement(current))
-            hard = set(x for x in implications if x > 0)
+            # Implications are computed once, up front, for the native shrink.
+            # They remain valid as the seed shrinks (it only adds assumptions).
+            implications = self._msolver.implies(-x for x in self.complement(seed))
+            # (only constraints: the Map solver may imply its own auxiliary
+            # variables, e.g., guards from MapSolver.next_seeds())
+            hard = [x-1 for x in implications if 0 < x <= self.n]
         else:
-            hard = set()
-
-        for i in seed:
-            if i not in current or i in hard:
-                continue
-            current.remove(i)
-
-            if self.check_subset(current):
-                current.add(i)
-            else:
-                current = set(self.s.unsat_core(offset=1))
-                if self._known_MSS > 0:
-                    implications = self._msolver.implies(-x for x in self.complement(current))
-                    hard = set(x for x in implications if x > 0)
+            hard = None
 
-        return current
+        return self.s.shrink_subset([i-1 for i in seed], hard, offset=1)
 
     def grow(self, seed):
-        current = set(seed)
-
         if self._known_MUS > 0:
-            implications = self._msolver.implies(current)
-            dont_add = set(x for x in implications if x < 0)
+            # Implications are computed once, up front, for the native grow.
+            # They remain valid as the seed grows (it only adds assumptions).
+            implications = self._msolver.implies(seed)
+            # (only constraints, as in shrink())
+            dont_add = [-x-1 for x in implications if -self.n <= x < 0]
         else:
-            dont_add = set()
-
-        for i in self.complement(current):
-            if i in current or i in dont_add:
-                continue
-            current.add(i)
-
-            if not self.check_subset(current):
-                current.remove(i)
-            else:
-                current = set(self.s.sat_subset(offset=1))
-                if self._known_MUS > 0:
-                    implications = self._msolver.implies(current)
-                    dont_add = set(x for x in implications if x < 0)
+            dont_add = None
 
-        return current
+        return self.s.grow_subset([i-1 for i in seed], dont_add, offset=1)
@@ -3,51 +3,108 @@ import os
 import queue
 import threading
 
+from . import resultcodec
+from . import utils
 from ..pyminisolvers import minisolvers
 
+# At most this many received results wait to be added to the solvers.  More
+# are dropped, and the master is asked to pause sending until this child
+# catches up (see add_received()).
+RECEIVE_QUEUE_LIMIT = 256
+
+
+def coalesce(results):
+    """Reduce a batch of received (type, encoded result) pairs to those whose
+    blocking clauses are still needed: drop any whose clause is subsumed by
+    the clause of another result of the same type in the batch (i.e., any
+    superset of another).  (The master has already filtered out duplicates
+    of earlier results.)
+
+    Each result is checked against the smaller ones kept before it, so this
+    is quadratic in the size of the batch, which is at most
+    RECEIVE_QUEUE_LIMIT.
+
+    Returns:
+        A list of (type, decoded result) pairs.
+    """
+    kept = []
+    for kind in ('S', 'U'):
+        new = {res for res in results if res[0] == kind}
+        minimal = []
+        for aset in sorted((frozenset(resultcodec.decode(res[1])) for res in new), key=len):
+            # (a distinct set of the same size is never a subset)
+            if not any(other <= aset for other in minimal if len(other) < len(aset)):
+                minimal.append(aset)
+        kept.extend((kind, array.array('i', sorted(aset))) for aset in minimal)
+    return kept
+
 
 class MCSEnumerator(object):
     def __init__(self, csolver, stats, config, pipe=None):
         self.solver = csolver.s
-        self.clauses = []
+        self.clausedb = csolver.clausedb
         self.blk_downs = []
         self.blk_ups = []
-        self.setup_clauses(csolver.dimacs)
         self.nvars = csolver.nvars
         self.nclauses = csolver.nclauses
         self.n = csolver.n
-        self.groups = csolver.groups
         self.instrumented_solver = None
+        self.incremental = not config['mcs_rebuild']  # keep one instrumented solver for all bounds
+        self.k = None  # the current bound
         self.stats = stats
         self.config = config
 
-        # workaround for Python 3.6+ changing defaultdict.iteritems -> defaultdict.items
-        if not hasattr(self.groups, 'items'):
-            self.groups.items = self.groups.iteritems
+        self.terminated = False  # set when told to stop (when running as a thread)
 
         self.pipe = pipe
         # if a pipe is provided, use it to receive results from other enumerators
         if self.pipe:
-            self.incoming_queue = queue.Queue()
+            self.incoming_queue = queue.Queue(RECEIVE_QUEUE_LIMIT)
+            self.overflowed = False  # set if results were dropped since the last add_received()
+            self.paused = False      # whether the master has been asked to pause sending
             self.recv_thread = threading.Thread(target=self.receive_thread)
             self.recv_thread.start()
 
     def receive_thread(self):
-        while self.pipe.poll(None):
+        for res in utils.incoming(self.pipe, self.config['comms_log']):
             with self.stats.time('receive'):
-                res = self.pipe.recv()
                 if res == 'terminate':
+                    if self.config['threaded']:
+                        # running as a thread: just stop enumerating
+                        self.terminated = True
+                        return
                     # exit process on terminate message
                     os._exit(0)
 
                 if self.config['comms_ignore']:
                     continue
 
-                self.incoming_queue.put(res)
+                for res in utils.unbatch(res):
+                    try:
+                        self.incoming_queue.put_nowait(res)
+                    except queue.Full:
+                        # only a hint, so drop it rather than fall further behind
+                        self.stats.increment_counter("receive dropped")
+                        self.overflowed = True
 
     def add_received(self, add_to_instrumented=False):
+        batch = []
         while not self.incoming_queue.empty():
-            rec = self.incoming_queue.get()
+            batch.append(self.incoming_queue.get())
+
+        # flow control: ask the master to hold results while the queue is
+        # overflowing (see transport.QueuedConnection)
+        overflowed, self.overflowed = self.overflowed, False
+        if overflowed != self.paused:
+            self.paused = overflowed
+            self.pipe.send(('pause',) if overflowed else ('resume',))
+
+        if not batch:
+            return
+        received = coalesce(batch)
+        self.stats.add_stat("receive coalesced", len(batch) - len(received))
+
+        for rec in received:
             if rec[0] == 'S':
                 self.blk_downs.append(rec[1])
                 self.block_down(self.solver, rec[1])
@@ -62,13 +119,12 @@ class MCSEnumerator(object):
     def check_sat(self, solver, assumps=None):
         if self.pipe:
             # Update blocking clauses as close as possible to calling solve()
-            self.add_received(add_to_instrumented=(solver == self.instrumented_solver))
-
-        return solver.solve(assumps)
+            # (in the instrumented solver, too, whenever it will be used again)
+            keep_instrumented = self.incremental and self.instrumented_solver is not None
+            self.add_received(add_to_instrumented=(keep_instrumented or solver == self.instrumented_solver))
 
-    def setup_clauses(self, dimacs):
-        for clause in dimacs:
-            self.clauses.append(array.array('i', [int(i) for i in clause.split()[:-1]]))
+        with self.stats.time('solve'):  # (counting SAT calls)
+            return solver.solve(assumps)
 
     def complement(self, aset):
         return set(range(1, self.n+1)).difference(aset)
@@ -78,22 +134,12 @@ class MCSEnumerator(object):
         solver.set_varcounts(self.nvars, self.n)
 
         assert (self.n <= self.nclauses)
-        gcnf_in = (self.n != self.nclauses)  # In gcnf, # of groups is less than # of clauses
 
         # Create new vars
         solver.new_vars(self.nvars + self.n)
 
-        # add clauses ...
-        if gcnf_in:
-            for groupid, clauses in self.groups.items():
-                for j in clauses:
-                    if groupid == 0:
-                        solver.add_clause(self.clauses[j])
-                    else:
-                        solver.add_clause_instrumented(self.clauses[j], groupid-1)
-        else:
-            for i, clause in enumerate(self.clauses):
-                solver.add_clause_instrumented(clause, i)
+        # add clauses (hard in group 0, instrumented with relaxation vars otherwise)
+        solver.add_clauses_bulk(self.clausedb.lits, self.clausedb.groups)
         for clause in self.blk_downs:
             self.block_down(solver, clause)
         for clause in self.blk_ups:
@@ -108,32 +154,114 @@ class MCSEnumerator(object):
         clause = [-(i+self.nvars) for i in frompoint]
         solver.add_clause(clause)
 
+    def add_bound(self, solver, included, k):
+        # Add "at most k of the included constraints relaxed," enforced only
+        # while the returned guard literal is assumed.  (As in
+        # add_atmost_instrumented(), the guard is repeated so that, when it
+        # is true, its copies use up all but k of the constraint's bound.)
+        guard = solver.new_var() + 1
+        lits = [-(i+self.nvars) for i in included]
+        solver.add_atmost([guard] * (len(lits) - k) + lits, len(lits))
+        return guard
+
+    def probe_bound(self, k):
+        # Check whether any MCS of size at most k is left (over all of the
+        # constraints, unlike enumerate(), which only relaxes those included).
+        guard = self.add_bound(self.instrumented_solver, range(1, self.n+1), k)
+        sat = self.check_sat(self.instrumented_solver, [guard])
+        self.instrumented_solver.add_clause([-guard])
+        return sat
+
+    def search_bound(self, k):
+        # Find the smallest bound from k with an MCS left: gallop up (probing
+        # k, k+1, k+3, k+7, ...) to a bound with one, then binary search
+        # back down.  Returns n+1 if there are none.
+        lo = k  # every bound below lo has no MCS left
+        step = 1
+        while True:
+            probe = min(lo + step - 1, self.n)
+            if self.probe_bound(probe):
+                hi = probe
+                break
+            lo = probe + 1
+            if probe == self.n:
+                return lo
+            step *= 2
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.probe_bound(mid):
+                hi = mid
+            else:
+                lo = mid + 1
+        return hi
+
+    def core_bound(self):
+        # Count disjoint cores among the soft constraints: any MCS left must
+        # relax at least one constraint from each.  Returns n+1 if there are
+        # no MCSes left.
+        assumps = set(range(self.nvars+1, self.nvars+self.n+1))
+        bound = 0
+        while not self.check_sat(self.instrumented_solver, sorted(assumps)):
+            core = [i+self.nvars for i in self.instrumented_solver.unsat_core(offset=1) if i <= self.n]
+            if not core:
+                return self.n + 1
+            assumps.difference_update(core)
+            bound += 1
+        return bound
+
+    def next_bound(self, included, k):
+        # The next bound to enumerate, at least k (see --mcs-strategy).
+        strategy = self.config['mcs_strategy']
+        if strategy == 'linear':
+            return k
+        bound = self.search_bound(k) if strategy == 'binary' else self.core_bound()
+        if bound <= k:
+            return k
+        # The bounds skipped have no MCS left, but exhausting each would have
+        # widened included (see enumerate()), so relax from all constraints.
+        included.update(range(1, self.n+1))
+        return bound
+
     def get_MSS(self):
-        model = self.instrumented_solver.get_model_trues(offset=1)
-        MSS = array.array('i', [x-self.nvars for x in model if x > self.nvars])
-        return MSS
+        # (only the selector variables, indexed from 1)
+        return self.instrumented_solver.get_model_trues(start=self.nvars, end=self.nvars+self.n, offset=1)
 
     def enumerate(self):
-        k = 1  # counting for AtMost constraints
         self.check_sat(self.solver, list(range(self.nvars+1, self.nvars+self.n+1)))
         included = set(self.solver.unsat_core(offset=1))
 
-        while self.check_sat(self.solver):
+        if self.incremental:
+            # one solver for every bound, keeping its learned clauses
             self.instrumented_solver = self.setup_solver()
-            self.instrumented_solver.add_atmost([-(i+self.nvars) for i in included], k)  # adding a bound for selector variables
 
-            instrumented = [(i+self.nvars) for i in self.complement(included)]
-            while self.check_sat(self.instrumented_solver, instrumented):
+        self.k = self.next_bound(included, 1)  # counting for AtMost constraints
+
+        while not self.terminated and self.check_sat(self.solver):
+            if self.incremental:
+                guard = self.add_bound(self.instrumented_solver, included, self.k)
+                instrumented = [guard]
+            else:
+                self.instrumented_solver = self.setup_solver()
+                self.instrumented_solver.add_atmost([-(i+self.nvars) for i in included], self.k)  # adding a bound for selector variables
+                instrumented = []
+
+            instrumented.extend((i+self.nvars) for i in self.complement(included))
+            while not self.terminated and self.check_sat(self.instrumented_solver, instrumented):
                 MSS = self.get_MSS()
                 res = ("S", MSS)
                 yield res
 
                 MCS = self.complement(MSS)
-                self.blk_downs.append(MCS)  # save for later solvers
+                if not self.incremental:
+                    self.blk_downs.append(MCS)  # save for later solvers
                 self.block_down(self.solver, MCS)
                 self.block_down(self.instrumented_solver, MCS)
-            included.update(self.instrumented_solver.unsat_core(offset=1))
-            k += 1
+            # (leaving out the guard, if in the core)
+            included.update(i for i in self.instrumented_solver.unsat_core(offset=1) if i <= self.n)
+            if self.incremental:
+                self.instrumented_solver.add_clause([-guard])  # retire this bound
+            self.k = self.next_bound(included, self.k + 1)
 
         if self.pipe:
             self.pipe.send(('done', self.stats))
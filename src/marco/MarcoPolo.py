@@ -1,19 +1,30 @@
 import os
 import queue
 import threading
+import time
+
+from . import partition
+from . import resultcodec
+from . import utils
 
 
 class MarcoPolo(object):
     def __init__(self, csolver, msolver, stats, config, pipe=None):
         self.subs = csolver
         self.map = msolver
-        self.seeds = SeedManager(msolver, stats, config)
+        self.cubes = None
+        if pipe and config['partition']:
+            # only take seeds from the cubes handed out by the master
+            self.cubes = partition.CubeClient(msolver, pipe)
+        self.seeds = SeedManager(msolver, stats, config, self.cubes)
         self.stats = stats
         self.config = config
-        self.bias_high = self.config['bias'] == 'MUSes'  # used frequently
         self.n = self.map.n   # number of constraints
         self.got_top = False  # track whether we've explored the complete set (top of the lattice)
 
+        self.terminated = False  # set when told to stop (when running as a thread)
+        self.last_report = 0  # when times were last reported to the master (see portfolio.py)
+
         self.pipe = pipe
         # if a pipe is provided, use it to receive results from other enumerators
         if self.pipe:
@@ -21,26 +32,40 @@ class MarcoPolo(object):
             self.recv_thread.start()
 
     def receive_thread(self):
-        while self.pipe.poll(None):
+        for res in utils.incoming(self.pipe, self.config['comms_log']):
             with self.stats.time('receive'):
-                res = self.pipe.recv()
                 if res == 'terminate':
+                    if self.config['threaded']:
+                        # running as a thread: just stop enumerating
+                        self.terminated = True
+                        if self.cubes is not None:
+                            self.cubes.receive(None)  # (if waiting for a cube)
+                        return
                     # exit process on terminate message
                     os._exit(0)
+                if res[0] == 'cube':
+                    # a new cube, or a narrowing of the current one
+                    self.cubes.receive(res)
+                    continue
+                if res[0] == 'bias':
+                    # switch bias, from the next seed (see portfolio.py)
+                    self.seeds.bias_change = res[1]
+                    continue
                 # Otherwise, we've received another result,
-                # update blocking clauses.
-                # Requires map solver to be thread-safe:
-                assert hasattr(self.map, "__synchronized__") and self.map.__synchronized__
+                # queue its blocking clause for the enumerating thread.
+                # Requires a mapsolvers.ConcurrentMapSolver:
+                assert hasattr(self.map, "queue_block_down")
 
                 if self.config['comms_ignore']:
                     continue
 
-                if res[0] == 'S':
-                    self.map.block_down(res[1])
-                elif res[0] == 'U':
-                    self.map.block_up(res[1])
-                else:
-                    assert False
+                for res in utils.unbatch(res):
+                    if res[0] == 'S':
+                        self.map.queue_block_down(resultcodec.decode(res[1]))
+                    elif res[0] == 'U':
+                        self.map.queue_block_up(resultcodec.decode(res[1]))
+                    else:
+                        assert False
 
     def record_delta(self, name, oldlen, newlen, up):
         if up:
@@ -50,10 +75,22 @@ class MarcoPolo(object):
             assert newlen <= oldlen
             self.stats.add_stat("delta.%s.down" % name, float(oldlen - newlen) / self.n)
 
+    def report_times(self):
+        # periodically send the master the times it needs to rebalance (see portfolio.py)
+        now = time.time()
+        if now - self.last_report >= self.config['adaptive'] / 2.0:
+            self.last_report = now
+            self.pipe.send(('stats', {category: self.stats.get_time(category) for category in ('shrink', 'grow', 'total')}))
+
     def enumerate(self):
         '''MUS/MCS enumeration with all the bells and whistles...'''
 
         for seed, known_max in self.seeds:
+            if self.terminated:
+                return
+
+            if self.pipe and self.config['adaptive']:
+                self.report_times()
 
             if self.config['verbose']:
                 print("- Initial seed: %s" % " ".join([str(x) for x in seed]))
@@ -63,7 +100,7 @@ class MarcoPolo(object):
                 oldlen = len(seed)
                 seed_is_sat, seed = self.subs.check_subset(seed, improve_seed=True)
                 self.record_delta('checkA', oldlen, len(seed), seed_is_sat)
-                known_max = (known_max and (seed_is_sat == self.bias_high))
+                known_max = (known_max and (seed_is_sat == self.seeds.bias_high))
 
             if self.config['verbose']:
                 print("- Seed is %s." % {True: "SAT", False: "UNSAT"}[seed_is_sat])
@@ -139,10 +176,14 @@ class MarcoPolo(object):
 
 
 class SeedManager(object):
-    def __init__(self, msolver, stats, config):
+    def __init__(self, msolver, stats, config, cubes=None):
         self.map = msolver
         self.stats = stats
         self.config = config
+        self.cubes = cubes  # a partition.CubeClient, if partitioning
+        # the map solver's bias (reversed with --smallest; see marco.setup_msolver())
+        self.bias_high = (self.config['bias'] == 'MUSes') != bool(self.config['smallest'])  # used frequently
+        self.bias_change = None  # a new bias to switch to, set by another thread
         self._seed_queue = queue.Queue()
 
     def __iter__(self):
@@ -150,17 +191,55 @@ class SeedManager(object):
 
     def __next__(self):
         with self.stats.time('seed'):
-            if not self._seed_queue.empty():
-                return self._seed_queue.get()
-            else:
-                seed, known_max = self.seed_from_solver()
-                if seed is None:
-                    raise StopIteration
-                return seed, known_max
+            while not self._seed_queue.empty():
+                seed, known_max = self._seed_queue.get()
+                # a queued seed may have been explored since (e.g., by a
+                # result from an earlier seed in its batch)
+                if self.map.check_seed(seed):
+                    return seed, known_max
+                self.stats.increment_counter("queued seed explored")
+
+            seed, known_max = self.seed_from_solver()
+            if seed is None:
+                raise StopIteration
+            return seed, known_max
 
     def add_seed(self, seed, known_max):
         self._seed_queue.put((seed, known_max))
 
     def seed_from_solver(self):
+        if self.bias_change is not None:
+            # Switch only here, with no queued seeds left, so that every seed
+            # (and its known_max) comes from the map solver's current bias.
+            self.bias_high, self.bias_change = self.bias_change, None
+            self.map.set_bias(self.bias_high)
+
         known_max = self.config['maximize']
-        return self.map.next_seed(), known_max
+        if self.cubes is None:
+            if not self.config['seed_batch']:
+                return self.map.next_seed(), known_max
+            # Take a batch of distinct seeds, queueing all but the first.
+            # (Each is known_max for as long as it is unexplored; see
+            # MapSolver.next_seeds().)
+            seeds = self.map.next_seeds(self.config['seed_batch'])
+            if not seeds:
+                return None, known_max
+            self.stats.add_stat("seed batch size", len(seeds))
+            for seed in seeds[1:]:
+                self.add_seed(seed, known_max)
+            return seeds[0], known_max
+
+        # take the next seed from this child's cube, moving on to another
+        # cube (from the master) whenever the current one is exhausted
+        self.cubes.update()
+        seed = self.map.next_seed() if self.cubes.cube_id >= 0 else None
+        while seed is None and self.cubes.next_cube():
+            seed = self.map.next_seed()
+
+        # A seed maximal (minimal) within the cube is only known to be
+        # maximal (minimal) overall if the cube excludes (includes) nothing.
+        if self.map.bias:
+            known_max = known_max and all(lit > 0 for lit in self.map.cube)
+        else:
+            known_max = known_max and all(lit < 0 for lit in self.map.cube)
+        return seed, known_max
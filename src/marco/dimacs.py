@@ -0,0 +1,324 @@
+"""Bulk parsing of DIMACS CNF and group-oriented CNF (GCNF) instances"""
+import array
+import collections
+import gzip
+import hashlib
+import mmap
+import os
+import re
+import struct
+import tempfile
+import time
+
+# NumPy is optional.  If available, it is used to convert text to integers.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Size of the blocks of text read and converted at once
+CHUNK_SIZE = 16 * 1024 * 1024
+
+_header_pattern = re.compile(rb'^p[ \t]+(\S+)[ \t]+(\d+)[ \t]+(\d+)(?:[ \t]+(\d+))?', re.MULTILINE)
+_comment_pattern = re.compile(rb'^c.*$', re.MULTILINE)
+_group_pattern = re.compile(rb'\{(\d+)\}')
+
+# Binary image of a ClauseDB: this header (magic, gcnf, nvars, nclauses, n, #lits,
+# size and mtime of the source file, digest of the source file), then the lits
+# array, then the groups array, both as native 4-byte ints.
+_image_magic = b"MARCOCDB"
+_image_header = struct.Struct("=8s7q32s")
+_image_source = struct.Struct("=2q")  # the size and mtime, updated in place
+_image_source_offset = struct.calcsize("=8s5q")
+
+# Suffix for cached images
+CACHE_SUFFIX = '.marcobin'
+
+# A source file modified this recently (ns) may be modified again without its
+# mtime changing, so its size and mtime are not trusted to identify it.
+_RACY_NS = 2 * 10**9
+
+
+class ClauseDB(object):
+    """A parsed CNF or GCNF instance, stored in flat arrays.
+
+    Attributes:
+        gcnf: True if the instance is in GCNF format.
+        nvars: Number of variables.
+        nclauses: Number of clauses (hard and soft).
+        n: Number of soft constraints (clauses in CNF, groups in GCNF).
+        lits: array of all clauses' literals, each clause terminated by a 0.
+        groups: array of each clause's group (0 for hard clauses in GCNF;
+                the i-th clause of a CNF instance is in group i+1).
+        digest: SHA-256 digest of the file it was parsed from (if known).
+        source_size, source_mtime: Size and mtime (ns) of that file (if known).
+        image: Path of the binary image it is mapped from (if any).
+    """
+    def __init__(self, gcnf, nvars, nclauses, n):
+        self.gcnf = gcnf
+        self.nvars = nvars
+        self.nclauses = nclauses
+        self.n = n
+        self.lits = array.array('i')
+        self.groups = array.array('i')
+        self.digest = b""
+        self.source_size = 0
+        self.source_mtime = 0
+        self.image = None
+
+    def write_image(self, f):
+        """Write the binary image of this ClauseDB to an open (binary) file."""
+        f.write(_image_header.pack(_image_magic, self.gcnf, self.nvars, self.nclauses, self.n, len(self.lits),
+                                   self.source_size, self.source_mtime, self.digest))
+        f.write(self.lits)
+        f.write(self.groups)
+
+    def dimacs_lines(self):
+        """Render every clause as a DIMACS line (with no group ID).
+
+        Returns:
+            A list of bytes objects, one per clause, each ending in " 0\\n".
+        """
+        # every literal is written as " <lit>", so " 0" only ever marks the end of a clause
+        text = b"".join([b" %d" % x for x in self.lits])
+        return [clause[1:] + b" 0\n" for clause in text.split(b" 0")[:-1]]
+
+    def group_clauses(self):
+        """Map each group to the indexes of its clauses.
+
+        Returns:
+            A defaultdict(list) from group to a list of 0-based clause indexes.
+        """
+        groups = collections.defaultdict(list)
+        for i, group in enumerate(self.groups):
+            groups[group].append(i)
+        return groups
+
+
+def open_instance(filename):
+    if filename.endswith('.gz'):
+        # use gzip to decompress
+        return gzip.open(filename, 'rb')
+    else:
+        # assume plain .cnf
+        return open(filename, 'rb')
+
+
+def read_chunks(f):
+    """Read a file in large blocks, each ending at a line break."""
+    rest = b""
+    while True:
+        data = f.read(CHUNK_SIZE)
+        if not data:
+            if rest:
+                yield rest
+            return
+        data = rest + data
+        end = data.rfind(b"\n") + 1
+        rest = data[end:]
+        if end:
+            yield data[:end]
+
+
+def parse_header(match):
+    gcnf_in = (match.group(1) == b"gcnf")
+    nvars = int(match.group(2))
+    nclauses = int(match.group(3))
+    # n = number of soft constraints
+    if gcnf_in:
+        n = int(match.group(4))
+    else:
+        n = nclauses
+    return ClauseDB(gcnf_in, nvars, nclauses, n)
+
+
+def read_header(filename):
+    """Parse just the header ('p' line) of a CNF or GCNF instance.
+
+    Only the lines up to the header are read (and decompressed, for .gz).
+
+    Returns:
+        A ClauseDB with empty lits and groups arrays.
+    """
+    with open_instance(filename) as f:
+        for line in f:
+            if line.startswith(b"p"):
+                match = _header_pattern.match(line)
+                if match is not None:
+                    return parse_header(match)
+    raise ValueError("No 'p' header line found in %s" % filename)
+
+
+def add_ints(a, text):
+    """Append all whitespace-separated integers in text to array a."""
+    if numpy is not None:
+        a.frombytes(numpy.fromstring(text, dtype=numpy.int32, sep=' ').tobytes())
+    else:
+        a.extend(map(int, text.split()))
+
+
+def read_dimacs(filename, n_only=False):
+    """Parse a CNF or GCNF instance (optionally gzipped).
+
+    Args:
+        filename: The file to read.
+        n_only: If True, only parse the header.  The returned ClauseDB will
+                have empty lits and groups arrays.
+
+    Returns:
+        A ClauseDB.
+    """
+    if n_only:
+        # We're only here to parse the number of constraints.
+        return read_header(filename)
+
+    db = None
+    with open_instance(filename) as f:
+        for chunk in read_chunks(f):
+            if db is None:
+                match = _header_pattern.search(chunk)
+                if match is None:
+                    # still in the comments before the header
+                    continue
+                db = parse_header(match)
+                chunk = chunk[match.end():]
+
+            chunk = _comment_pattern.sub(b"", chunk)
+            if db.gcnf:
+                # pull out the '{x}' group IDs, then parse the rest as plain clauses
+                db.groups.extend(int(x) for x in _group_pattern.findall(chunk))
+                chunk = _group_pattern.sub(b" ", chunk)
+            add_ints(db.lits, chunk)
+
+    if db is None:
+        raise ValueError("No 'p' header line found in %s" % filename)
+
+    if not db.gcnf:
+        db.groups = array.array('i', range(1, db.nclauses+1))
+
+    assert db.lits.count(0) == db.nclauses
+    assert len(db.groups) == db.nclauses
+    assert db.nclauses == 0 or 0 <= min(db.groups) <= max(db.groups) <= db.n
+
+    return db
+
+
+def load_image(filename):
+    """Map a binary image written by ClauseDB.write_image().
+
+    The file is mapped copy-on-write, so the lits and groups of the returned
+    ClauseDB are memoryviews that share pages with every other process
+    mapping the same file (and can be passed directly to the solvers).
+
+    Returns:
+        A ClauseDB.
+    """
+    with open(filename, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    if len(mm) < _image_header.size:
+        raise ValueError("%s is not a MARCO clause database image" % filename)
+    magic, gcnf, nvars, nclauses, n, nlits, source_size, source_mtime, digest = _image_header.unpack_from(mm)
+    if magic != _image_magic:
+        raise ValueError("%s is not a MARCO clause database image" % filename)
+
+    db = ClauseDB(bool(gcnf), nvars, nclauses, n)
+    db.digest = digest
+    db.source_size = source_size
+    db.source_mtime = source_mtime
+    db.image = filename
+    start = _image_header.size
+    mid = start + 4*nlits
+    end = mid + 4*nclauses
+    if len(mm) != end:
+        raise ValueError("%s is truncated or corrupt" % filename)
+    view = memoryview(mm)
+    db.lits = view[start:mid].cast('i')
+    db.groups = view[mid:end].cast('i')
+    return db
+
+
+def file_digest(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(block)
+    return h.digest()
+
+
+def cache_dir():
+    """Directory for cached images: marco/ in $XDG_CACHE_HOME (by default,
+    ~/.cache)."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'marco')
+
+
+def cache_path(filename):
+    """Path of the cached image of an instance, named for its real path."""
+    source = os.path.realpath(filename)
+    key = hashlib.sha256(os.fsencode(source)).hexdigest()[:16]
+    return os.path.join(cache_dir(), "%s-%s%s" % (os.path.basename(source), key, CACHE_SUFFIX))
+
+
+def _source_stat(st):
+    """The (size, mtime) recorded for a source file with the given stat
+    result.  A racily recent mtime is recorded as 0, so the file is hashed
+    on its next use rather than trusted."""
+    mtime = st.st_mtime_ns
+    if time.time_ns() - mtime < _RACY_NS:
+        mtime = 0
+    return st.st_size, mtime
+
+
+def read_cached(filename):
+    """Load an instance from its cached binary image, (re)building the cache
+    first if it is missing or was built from different file contents.
+
+    The image is stored in cache_dir() (see cache_path()).  If the size and
+    mtime of the instance match those recorded in the image, it is used
+    directly.  Otherwise, the instance is hashed: if its digest matches, the
+    image is used (and the new size and mtime are recorded in it), and if
+    not, it is rebuilt.  If the image cannot be written, the instance is just
+    parsed.
+
+    Returns:
+        A ClauseDB, mapped from the cached image whenever possible.
+    """
+    source = _source_stat(os.stat(filename))
+    path = cache_path(filename)
+    try:
+        db = load_image(path)
+    except (IOError, OSError, ValueError):
+        db = None  # no usable cache
+    if db is not None and source[1] and (db.source_size, db.source_mtime) == source:
+        return db
+
+    digest = file_digest(filename)
+    if db is not None and db.digest == digest:
+        # same contents (e.g., the file was touched or copied over)
+        try:
+            with open(path, 'r+b') as f:
+                f.seek(_image_source_offset)
+                f.write(_image_source.pack(*source))
+        except (IOError, OSError):
+            pass  # it will be hashed again next time
+        return db
+
+    db = read_dimacs(filename)
+    db.digest = digest
+    db.source_size, db.source_mtime = source
+    # write to a temporary file and then rename it, so a concurrent run
+    # never maps a partially written image
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmppath = tempfile.mkstemp(prefix='.marco-', suffix=CACHE_SUFFIX, dir=os.path.dirname(path))
+    except (IOError, OSError):
+        return db
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            db.write_image(f)
+        os.chmod(tmppath, 0o644)  # mkstemp() creates it private
+        os.replace(tmppath, path)
+    except (IOError, OSError):
+        os.remove(tmppath)
+        return db
+    return load_image(path)
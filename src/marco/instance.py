@@ -0,0 +1,110 @@
+"""Lightweight probing of input instances: their format and size, found
+without constructing any solver or parsing the full instance."""
+import collections
+import re
+
+from . import dimacs
+
+# format: 'cnf', 'gcnf', or 'smt'
+# nvars:  number of variables (None for SMT)
+# n:      number of constraints (None if it can't be determined without a full parse)
+InstanceInfo = collections.namedtuple('InstanceInfo', ['format', 'nvars', 'n'])
+
+# whitespace, comments, quoted symbols, string literals, parentheses, and other atoms
+_smt2_token = re.compile(r'\s+|;[^\n]*|\|[^|]*\||"(?:[^"]|"")*"|[()]|[^\s()|";]+')
+
+
+def probe(filename, filetype):
+    """Find the format and size of an instance.
+
+    Args:
+        filename: The file to probe.
+        filetype: 'cnf' (for CNF or GCNF) or 'smt'.
+
+    Returns:
+        An InstanceInfo.
+    """
+    if filetype == 'cnf':
+        db = dimacs.read_header(filename)
+        return InstanceInfo('gcnf' if db.gcnf else 'cnf', db.nvars, db.n)
+    else:
+        return InstanceInfo('smt', None, count_smt2_constraints(filename))
+
+
+def count_smt2_constraints(filename):
+    """Count the constraints that SMTsolvers.read_smt2() will find in a file,
+    by scanning its top-level forms: one per assert, unless there is a single
+    assert of an 'and' (possibly inside let bindings), in which case one per
+    argument of that 'and'.
+
+    Returns:
+        The count, or None if there is a single assert of something else
+        (which may still turn out to be an 'and' after parsing).
+    """
+    with open(filename) as f:
+        text = f.read()
+
+    asserts = 0
+    and_args = None
+    # Progress through the body of the first assert:
+    #   'body'     -- expecting the body expression, at depth level
+    #   'head'     -- expecting the operator of a body expression
+    #   'bindings' -- after 'let', expecting its bindings
+    #   'skip'     -- inside let bindings
+    #   'and'      -- counting the arguments of an 'and'
+    #   'done'     -- finished (or found something other than let/and)
+    stage = None
+    level = 0
+    command = False  # expecting the name of a top-level command
+    depth = 0
+    for match in _smt2_token.finditer(text):
+        token = match.group()
+        if token[0].isspace() or token[0] == ';':
+            continue
+
+        if token == '(':
+            depth += 1
+            command = (depth == 1)
+            if stage == 'body' and depth == level+1:
+                stage = 'head'
+            elif stage == 'bindings' and depth == level+2:
+                stage = 'skip'
+            elif stage == 'and' and depth == level+2:
+                and_args += 1
+            elif stage in ('head', 'bindings'):
+                stage = 'done'
+            continue
+
+        if token == ')':
+            depth -= 1
+            if stage == 'skip' and depth == level+1:
+                # the let's body follows its bindings
+                level += 1
+                stage = 'body'
+            elif stage in ('body', 'head', 'bindings') or (stage == 'and' and depth == level):
+                stage = 'done'
+            continue
+
+        if command:
+            command = False
+            if token == 'assert':
+                asserts += 1
+                if asserts == 1:
+                    stage = 'body'
+                    level = 1
+        elif stage == 'head':
+            if token == 'and':
+                stage = 'and'
+                and_args = 0
+            elif token == 'let':
+                stage = 'bindings'
+            else:
+                stage = 'done'
+        elif stage == 'and' and depth == level+1:
+            and_args += 1
+        elif stage in ('body', 'bindings'):
+            stage = 'done'
+
+    if asserts != 1:
+        return asserts
+    return and_args
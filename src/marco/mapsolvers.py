@@ -1,5 +1,8 @@
 import abc
 import array
+import collections
+import threading
+import time
 
 from ..pyminisolvers import minisolvers
 
@@ -22,6 +25,13 @@ class MapSolver(object):
         self.bias = bias
         self.all_n = set(range(1, n+1))  # used in complement fairly frequently
         self.dump = dump
+        self.cube = []  # literals that restrict the seeds returned by next_seed()
+
+    def set_cube(self, cube):
+        """Restrict next_seed() to seeds within a cube (a list of literals:
+        i to require constraint i in the seed, -i to exclude it).  Blocking
+        clauses and other queries are unaffected."""
+        self.cube = list(cube)
 
     @abc.abstractmethod
     def next_seed(self):
@@ -35,6 +45,45 @@ class MapSolver(object):
         """
         return self._solver.check_complete(positive_lits=seed)
 
+    def next_seeds(self, count):
+        """Find up to count pairwise-distinct unexplored seeds, as if by
+        calling next_seed() repeatedly, blocking down from each seed (up,
+        for a low bias) in between.  Seeds of a high (low) bias are thus
+        incomparable, and each is maximal (minimal) among all unexplored
+        seeds, not only those left after blocking the ones before it.  The
+        blocking clauses are enabled by a guard literal (assumed along with
+        the cube) only while finding the batch, so every seed in it remains
+        unexplored afterward.
+
+        Returns:
+            A list of seeds, empty if there are none.
+        """
+        seed = self.next_seed()
+        if seed is None:
+            return []
+        seeds = [seed]
+        if count == 1:
+            return seeds
+
+        guard = self._solver.new_var() + 1
+        cube = self.cube
+        self.cube = cube + [guard]
+        try:
+            while len(seeds) < count:
+                # (not dumped, as it is temporary)
+                if self.bias is False:
+                    self._solver.add_clause([-guard] + [-i for i in seed])
+                else:
+                    self._solver.add_clause([-guard] + list(self.complement(seed)))
+                seed = self.next_seed()
+                if seed is None:
+                    break
+                seeds.append(seed)
+        finally:
+            self.cube = cube
+            self._solver.add_clause([-guard])  # remove the temporary clauses
+        return seeds
+
     def implies(self, assumptions=None):
         """Get implications (level-0 decisions) of the current instance.
         If assumptions are provided, get implications of the current
@@ -129,8 +178,8 @@ class MapSolver(object):
 
 
 class MinicardMapSolver(MapSolver):
-    def __init__(self, n, bias=True, rand_seed=None):   # bias=True is a high/inclusion/MUS bias; False is a low/exclusion/MSS bias.
-        super(MinicardMapSolver, self).__init__(n, bias)
+    def __init__(self, n, bias=True, rand_seed=None, dump=None):   # bias=True is a high/inclusion/MUS bias; False is a low/exclusion/MSS bias.
+        super(MinicardMapSolver, self).__init__(n, bias, dump)
 
         if bias:
             self.k = n  # initial lower bound on # of True variables
@@ -164,9 +213,25 @@ class MinicardMapSolver(MapSolver):
         else:
             self._solver.add_atmost([(x+1) for x in range(self.n * 2)], self.n)
 
-    def solve_with_bound(self, k):
+        # assumptions for each bound k are windows of one array (see bound_assumptions())
+        self._windows = None
+        self._windows_cube = None  # the cube they were built for
+
+    def bound_assumptions(self, k):
         # same assumptions work both for high bias / atleast and for low bias / atmost
-        return self._solver.solve( [-(self.n+x+1) for x in range(k)] + [(self.n+k+x+1) for x in range(self.n-k)] )
+        # The array is laid out as [x_1..x_n, cube, -x_1..-x_n] for the
+        # bound-setting variables x_i, so the window starting at k holds
+        # x_(k+1)..x_n, the cube, and -x_1..-x_k: the assumptions for bound k
+        # as a memoryview, without copying.  It is rebuilt only when the cube
+        # changes.
+        if self._windows_cube != self.cube:
+            bound = list(range(self.n+1, self.n*2+1))
+            self._windows = memoryview(array.array('i', bound + self.cube + [-x for x in bound]))
+            self._windows_cube = list(self.cube)
+        return self._windows[k:k + self.n + len(self.cube)]
+
+    def solve_with_bound(self, k):
+        return self._solver.solve(self.bound_assumptions(k))
 
     def check_seed(self, seed):
         """Check whether a given seed is still unexplored.
@@ -189,28 +254,53 @@ class MinicardMapSolver(MapSolver):
         if self.solve_with_bound(self.k):
             return self.get_seed()
 
-        if self.bias:
-            if not self.solve_with_bound(0):
-                # no more models
-                return None
-            # move to the next bound
-            self.k -= 1
-        else:
-            if not self.solve_with_bound(self.n):
-                # no more models
-                return None
-            # move to the next bound
-            self.k += 1
-
-        while not self.solve_with_bound(self.k):
-            if self.bias:
-                self.k -= 1
+        # The bound must move (down for high bias, up for low bias) by some
+        # distance in [1, limit].  Having a model at a distance implies having
+        # one at every greater distance, so search for the smallest: gallop
+        # out from 1, then binary search back, using the size of each model
+        # found to skip ahead to the distance it already proves.
+        step = -1 if self.bias else 1
+        limit = self.k if self.bias else self.n - self.k
+
+        def distance(seed):
+            return (self.k - len(seed)) if self.bias else (len(seed) - self.k)
+
+        if not self.solve_with_bound(self.k + step * limit):
+            # no more models
+            return None
+        best = self.get_seed()
+        lo = 1               # every distance below lo has no model
+        hi = distance(best)  # distance of the best model so far
+
+        dist = 1
+        while dist < hi:
+            if self.solve_with_bound(self.k + step * dist):
+                best = self.get_seed()
+                hi = distance(best)
+                break
+            lo = dist + 1
+            dist *= 2
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.solve_with_bound(self.k + step * mid):
+                best = self.get_seed()
+                hi = distance(best)
             else:
-                self.k += 1
+                lo = mid + 1
 
+        self.k += step * hi
         assert 0 <= self.k <= self.n
 
-        return self.get_seed()
+        return best
+
+    def next_seeds(self, count):
+        seeds = super(MinicardMapSolver, self).next_seeds(count)
+        if seeds:
+            # The bound may have moved past seeds that were only blocked
+            # while finding the batch; the first seed's size is still a bound.
+            self.k = len(seeds[0])
+        return seeds
 
     def block_above_size(self, size):
         self._solver.add_atmost( [(x+1) for x in range(self.n)], size)
@@ -238,7 +328,76 @@ class MinisatMapSolver(MapSolver):
             self._solver.set_rnd_pol(True)
 
     def next_seed(self):
-        if self._solver.solve():
+        if self._solver.solve(self.cube):
             return self.get_seed()
         else:
             return None
+
+    def set_bias(self, bias):
+        """Change the solver's bias (True or False, as in __init__()) for
+        subsequent seeds."""
+        assert bias is not None and self.bias is not None
+        self.bias = bias
+        self._solver.set_polarities(bias, 0, self.n)
+
+
+class ConcurrentMapSolver(object):
+    """Wrap a MapSolver used by one enumerating thread while other threads
+    (e.g., one receiving results from other processes) supply blocking clauses.
+
+    Other threads call queue_block_down() and queue_block_up(), which only
+    append to a deque (an atomic operation, so no lock is taken).  Every call
+    to any of the wrapped solver's methods first drains that queue into the
+    solver, so the new blocking clauses take effect right before its next
+    solve.  Method calls hold a per-instance lock, and any time spent waiting
+    for it is recorded in the given Statistics object.
+    """
+    def __init__(self, msolver, stats=None):
+        self._msolver = msolver
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+        self._stats = stats
+
+    def queue_block_down(self, frompoint):
+        self._queue.append((False, frompoint))
+
+    def queue_block_up(self, frompoint):
+        self._queue.append((True, frompoint))
+
+    def _acquire(self):
+        if not self._lock.acquire(False):
+            start = time.time()
+            self._lock.acquire()
+            if self._stats is not None:
+                self._stats.increment_counter("map lock contended")
+                self._stats.add_stat("map lock wait", time.time() - start)
+
+    def _drain(self):
+        # must hold self._lock
+        count = 0
+        while self._queue:
+            up, frompoint = self._queue.popleft()
+            if up:
+                self._msolver.block_up(frompoint)
+            else:
+                self._msolver.block_down(frompoint)
+            count += 1
+        if count and self._stats is not None:
+            self._stats.add_stat("map queue drained", count)
+
+    def __getattr__(self, name):
+        attr = getattr(self._msolver, name)
+        if not callable(attr):
+            return attr
+
+        def locked(*args, **kwargs):
+            self._acquire()
+            try:
+                self._drain()
+                return attr(*args, **kwargs)
+            finally:
+                self._lock.release()
+
+        # cache the wrapper, so later calls don't come through __getattr__
+        setattr(self, name, locked)
+        return locked
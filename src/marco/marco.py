@@ -1,13 +1,23 @@
 import argparse
+import asyncio
 import atexit
+import collections
+import concurrent.futures
 import copy
 import multiprocessing
 import os
-import select
 import signal
 import sys
+import tempfile
 import threading
-
+import time
+
+from . import dimacs
+from . import instance
+from . import partition
+from . import portfolio
+from . import resultcodec
+from . import transport
 from . import utils
 from . import mapsolvers
 from . import CNFsolvers
@@ -62,6 +72,8 @@ def parse_args(args_list=None):
                                help="name of file to process")
     required_args.add_argument('--check-muser', action='store_true',
                                help="just run a check of the MUSer2 helper application and exit (used to configure tests).")
+    required_args.add_argument('--connect', type=str, default=None, metavar='HOST:PORT',
+                               help="run as a worker for a master started with --listen HOST:PORT (possibly on another host): the master sends the input and all options.")
 
     # Standard arguments
     parser.add_argument('-v', '--verbose', action='count', default=0,
@@ -74,11 +86,15 @@ def parse_args(args_list=None):
                         help="limit the runtime to TIMEOUT seconds")
     parser.add_argument('-l', '--limit', type=int, default=None,
                         help="limit number of subsets output (counting both MCSes and MUSes)")
+    parser.add_argument('--smallest', type=int, default=None, metavar='K',
+                        help="find MUSes (or, with -b MCSes, MCSes) in increasing order of size, stopping after the K smallest (uses a single thread; other results found along the way are output as well).")
     type_group = parser.add_mutually_exclusive_group()
     type_group.add_argument('--cnf', action='store_true',
                             help="assume input is in DIMACS CNF or Group CNF format (autodetected if filename is *.[g]cnf or *.[g]cnf.gz).")
     type_group.add_argument('--smt', action='store_true',
                             help="assume input is in SMT2 format (autodetected if filename is *.smt2).")
+    parser.add_argument('--cache', action='store_true',
+                        help="for CNF/GCNF input, keep a precompiled binary copy of the instance in a cache directory ($XDG_CACHE_HOME/marco, by default ~/.cache/marco) and load that directly in later runs (it is rebuilt automatically whenever the input's contents change).")
     parser.add_argument('--print-mcses', action='store_true',
                         help="for every satisfiable subset found, print the constraints in its complementary MCS instead of the MSS.")
 
@@ -92,11 +108,21 @@ def parse_args(args_list=None):
                                   help="override the bias for all threads (toward MUSes or MCSes), but use the default number of threads.")
     par_types_group.add_argument('--parallel', type=str, default=None,
                                  help="specify the exact number of threads and mode for each as a comma-delimited list of modes selected from: 'MUS', 'MCS', 'MCSonly' -- e.g., \"MUS,MUS,MCS,MCSonly\" will run four separate threads: two MUS biased, one MCS biased, and one with a CAMUS-style MCS enumerator.")
+    par_group.add_argument('--backend', type=str, choices=['processes', 'threads', 'tcp'], default=None,
+                           help="run each thread as a separate process; as a thread of a single process that shares one copy of the parsed input and passes results without pickling them (the solvers run outside of Python's global interpreter lock); or as a separate process connected to the master over TCP (see --listen) [default: processes, or tcp with --listen].")
+    par_group.add_argument('--listen', type=str, default=None, metavar='HOST:PORT',
+                           help="with the tcp backend, wait for workers (started on this or other hosts with --connect) to connect to HOST:PORT, one per thread, instead of starting them on this host.")
+    par_group.add_argument('--authkey', type=str, default=os.environ.get('MARCO_AUTHKEY'),
+                           help="key shared by the master and its workers for --listen and --connect [default: the MARCO_AUTHKEY environment variable].")
 
     # Experimental / Research arguments
     exp_group = parser.add_argument_group('Experimental / research options', "These can typically be ignored; the defaults will give the best performance.")
     exp_group.add_argument('--mcs-only', action='store_true', default=False,
                            help="enumerate MCSes only using a CAMUS-style MCS enumerator.")
+    exp_group.add_argument('--mcs-strategy', type=str, choices=['linear', 'binary', 'core'], default='linear',
+                           help="for MCS-only enumeration (--mcs-only or MCSonly threads), how to choose the next MCS size bound once one is exhausted: 'linear' tries each size in turn; 'binary' skips sizes with no MCSes by a galloping/binary search; 'core' skips to a lower bound given by disjoint unsat cores [default: linear].")
+    exp_group.add_argument('--mcs-rebuild', action='store_true', default=False,
+                           help="for MCS-only enumeration, rebuild the solver for each MCS size bound rather than reusing one solver for all bounds -- used only for comparison.")
     exp_group.add_argument('--rnd-init', type=int, nargs='?', const=1, default=None,   # default = val if --rnd-init not specified; const = val if --rnd-init specified w/o a value
                            help="only used if *not* using --parallel: initialize variable activity in solvers to random values (optionally specify a random seed [default: 1 if --rnd-init specified without a seed]).")
     exp_group.add_argument('--improved-implies', action='store_true',
@@ -104,6 +130,10 @@ def parse_args(args_list=None):
     exp_group.add_argument('--dump-map', nargs='?', type=argparse.FileType('w'),
                            help="dump clauses added to the Map formula to the given file.")
     solver_group = exp_group.add_mutually_exclusive_group()
+    # (MUSer2 runs as a separate process that reads the full instance for every
+    # shrink; each solver keeps one started in advance, idle until its next
+    # shrink, to hide process startup.  Minisat keeps the instance loaded in
+    # the solver library: see CNFsolvers.py.)
     solver_group.add_argument('--force-minisat', action='store_true',
                               help="use Minisat in place of MUSer2 for CNF (NOTE: much slower and usually not worth doing!)")
     exp_group.add_argument('--nomax', action='store_true',
@@ -113,8 +143,22 @@ def parse_args(args_list=None):
     comms_group = exp_group.add_mutually_exclusive_group()
     comms_group.add_argument('--comms-disable', action='store_true',
                              help="disable the communications between children (i.e., when the master receives a result from a child, it won't send to other children).")
+    comms_group.add_argument('--comms-log', action='store_true',
+                             help="distribute results to children through a fixed-size log in shared memory that every child reads, rather than having the master send each result to every child through its pipe (results a child falls too far behind to read are dropped).")
     comms_group.add_argument('--comms-ignore', action='store_true',
                              help="send results out to children, but do not *use* the results in children (i.e., do not add blocking clauses based on them) -- used only for determining cost of communication.")
+    exp_group.add_argument('--partition', type=int, default=None, metavar='DEPTH',
+                           help="in parallel mode, split the space of seeds into 2^DEPTH parts (fixing DEPTH constraints in or out) handed out to the MUS/MCS-biased threads by the master, with idle threads stealing half of another thread's part once all are handed out.")
+    exp_group.add_argument('--comms-batch', type=int, default=None, metavar='N',
+                           help="send results between children and the master in batches of up to N results (a partial batch is sent once its oldest result has waited --comms-batch-window seconds).")
+    exp_group.add_argument('--comms-batch-window', type=float, default=0.01, metavar='SECONDS',
+                           help="with --comms-batch, the longest time a result waits to be sent in a batch [default: 0.01].")
+    exp_group.add_argument('--seed-batch', type=int, default=None, metavar='N',
+                           help="take seeds from the map solver in batches of up to N distinct seeds at a time, queueing them to be checked, grown, and shrunk in turn (any explored in the meantime are skipped).")
+    exp_group.add_argument('--adaptive', type=float, default=None, metavar='SECONDS',
+                           help="in parallel mode, every SECONDS, compare the yield of the MUS/MCS-biased threads (new results per second, duplicate rate, and time spent in shrink vs. grow) and switch the bias of an unproductive thread.")
+    exp_group.add_argument('--adaptive-log', type=str, default=None, metavar='FILE',
+                           help="with --adaptive, write each rebalancing decision to FILE [default: stderr, with -vv].")
 
     # parse args_list and return resulting arguments
     args = parser.parse_args(args_list)
@@ -123,9 +167,16 @@ def parse_args(args_list=None):
     if args.inputfile:
         args.inputfile.close()
 
+    if args.smallest is not None and args.parallel is None and args.threads is None:
+        # one thread, so that results are found in order of size
+        args.parallel = 'MCS' if args.bias == 'MCSes' else 'MUS'
+
     if args.parallel is None:
         args.parallel = default_parallel_config(args.threads, args.bias)
 
+    if args.backend is None:
+        args.backend = 'tcp' if args.listen else 'processes'
+
     return args
 
 
@@ -139,12 +190,59 @@ def check_args(args):
             sys.exit(1)
         sys.exit(0)
 
-    if not (args.smt or args.cnf or args.inputfile.name.endswith(('.cnf', '.cnf.gz', '.gcnf', '.gcnf.gz', '.smt2'))):
+    if args.comms_batch is not None and args.comms_batch < 1:
+        error_exit("Invalid batch size: %d" % args.comms_batch, "--comms-batch must be at least 1.")
+
+    if args.partition is not None and args.partition < 1:
+        error_exit("Invalid partition depth: %d" % args.partition, "--partition must be at least 1.")
+
+    if args.mcs_rebuild and args.mcs_strategy != 'linear':
+        error_exit("--mcs-rebuild can only be used with --mcs-strategy linear.")
+
+    if args.seed_batch is not None:
+        if args.seed_batch < 1:
+            error_exit("Invalid seed batch size: %d" % args.seed_batch, "--seed-batch must be at least 1.")
+        if args.partition:
+            error_exit("--seed-batch cannot be used with --partition.")
+
+    if args.smallest is not None:
+        if args.smallest < 1:
+            error_exit("Invalid number of results: %d" % args.smallest, "--smallest must be at least 1.")
+        if args.parallel not in ['MUS', 'MCS']:
+            error_exit("--smallest can only be used with a single MUS- or MCS-biased thread.")
+        if args.nomax or args.partition:
+            error_exit("--smallest cannot be used with --nomax or --partition.")
+
+    if args.adaptive is not None:
+        if args.adaptive <= 0:
+            error_exit("Invalid rebalancing interval: %g" % args.adaptive, "--adaptive must be positive.")
+        if args.nomax:
+            error_exit("--adaptive cannot be used with --nomax (threads have no bias to switch).")
+    elif args.adaptive_log:
+        error_exit("--adaptive-log can only be used with --adaptive.")
+
+    if args.backend == 'tcp':
+        if args.comms_log:
+            error_exit("--comms-log cannot be used with the tcp backend.")
+        if args.listen:
+            check_address(args.listen)
+            get_authkey(args)
+    elif args.listen:
+        error_exit("--listen can only be used with the tcp backend.")
+
+    filetype = input_filetype(args)
+    if filetype is None:
         error_exit(
             "Cannot determine filetype (cnf or smt) of input: %s" % args.inputfile.name,
             "Please provide --cnf or --smt option, or --help to see all options."
         )
 
+    # check that the input can be read, and find its size (without loading it)
+    try:
+        return instance.probe(args.inputfile.name, filetype)
+    except (IOError, OSError, ValueError, UnicodeDecodeError) as e:
+        error_exit("Unable to read input file: %s" % args.inputfile.name, exception=e)
+
 
 def at_exit(stats):
     # print stats
@@ -236,31 +334,223 @@ def setup_parallel(args, stats):
     else:
         argslist.append(args)
 
-    pipes = []
-    procs = []
-
-    for i, args in enumerate(argslist):
-        pipe, child_pipe = multiprocessing.Pipe()
-        pipes.append(pipe)
+    threaded = (args.backend == 'threads')
 
+    seeds = []
+    for i in range(len(argslist)):
         # TODO: Handle randomization with non-homogeneous thread modes
         if not args.all_randomized and i == 0:
             # don't randomize the first thread in this case
-            seed = None
+            seeds.append(None)
         else:
-            seed = i+1
+            seeds.append(i+1)
+
+    if args.backend == 'tcp':
+        args.result_log_file = None
+        return setup_tcp(args, list(zip(argslist, seeds)))
+
+    # With several children, parse a CNF instance once here rather than in each child.
+    clausedb = None
+    clausedb_file = None
+    if len(argslist) > 1 and input_filetype(args) == 'cnf':
+        if threaded:
+            # threads can all use the same ClauseDB directly
+            clausedb = load_clausedb(args.inputfile.name, args.cache)
+        else:
+            clausedb_file = share_clausedb(args.inputfile.name, args.cache)
+    for childargs in argslist:
+        childargs.clausedb = clausedb
+        childargs.clausedb_file = clausedb_file
+
+    # With --comms-log, the master writes results to a shared log for the children to read.
+    args.result_log_file = None
+    if len(argslist) > 1 and args.comms_log:
+        fd, args.result_log_file = shared_tempfile('.log')
+        utils.ResultLog.create(fd, len(argslist))
+        os.close(fd)
+    for i, childargs in enumerate(argslist):
+        childargs.result_log_file = args.result_log_file
+        childargs.child_id = i
 
-        proc = multiprocessing.Process(target=run_enumerator, args=(stats, args, child_pipe, seed))
+    pipes = []
+    procs = []
+
+    for args, seed in zip(argslist, seeds):
+        if threaded:
+            pipe, child_pipe = utils.thread_pipe()
+        else:
+            pipe, child_pipe = multiprocessing.Pipe()
+        pipes.append(pipe)
+
+        if threaded:
+            # each thread keeps its own statistics (a Statistics object is not thread-safe)
+            proc = EnumeratorThread(pipe, target=run_enumerator, args=(utils.Statistics(), args, child_pipe, seed))
+        else:
+            proc = multiprocessing.Process(target=run_enumerator, args=(stats, args, child_pipe, seed))
         procs.append(proc)
 
-    return pipes, procs
+    return transport.LocalTransport(pipes, procs)
+
+
+def setup_tcp(args, jobs):
+    '''Set up a TCPHub to run the given jobs ((args, seed) pairs) in workers
+    connected over TCP: workers started with --connect (with --listen), or
+    otherwise local processes started by the hub.'''
+    if args.listen:
+        address = check_address(args.listen)
+        authkey = get_authkey(args)
+        # remote workers are sent the input itself
+        with open(args.inputfile.name, 'rb') as f:
+            data = f.read()
+    else:
+        address = ('127.0.0.1', 0)
+        authkey = os.urandom(32)
+        data = None  # local workers can read the input file directly
+
+    hubjobs = []
+    for jobargs, seed in jobs:
+        jobargs = copy.copy(jobargs)
+        jobargs.inputfile = None  # (replaced by the worker)
+        jobargs.dump_map = None   # (open file objects can't be sent)
+        jobargs.clausedb = None
+        jobargs.clausedb_file = None
+        jobargs.result_log_file = None
+        hubjobs.append((jobargs, seed, args.inputfile.name, data))
+
+    try:
+        hub = transport.TCPHub(address, authkey, hubjobs)
+    except (IOError, OSError) as e:
+        error_exit("Unable to listen on %s." % args.listen, exception=e)
+
+    if args.listen:
+        sys.stderr.write("Waiting for %d workers to connect to %s:%d.\n" % ((len(jobs),) + hub.address))
+    else:
+        hub.workers = [multiprocessing.Process(target=run_worker, args=(hub.address, authkey), daemon=True) for _ in jobs]
+    return hub
+
+
+def check_address(text):
+    try:
+        return transport.parse_address(text)
+    except ValueError as e:
+        error_exit(str(e))
+
+
+def get_authkey(args):
+    if not args.authkey:
+        error_exit("No authentication key given for the workers' connections.", "Use --authkey or set MARCO_AUTHKEY (the same key on the master and every worker).")
+    return args.authkey.encode()
+
+
+def connect_worker(args):
+    '''Run as a worker for the master given by args.connect (see --listen).'''
+    run_worker(check_address(args.connect), get_authkey(args))
+
+
+def run_worker(address, authkey):
+    '''Connect to a master's TCPHub at the given address and run the job it
+    hands out (see setup_tcp()).'''
+    try:
+        client = transport.TCPClient(address, authkey)
+    except (IOError, OSError, EOFError, multiprocessing.AuthenticationError) as e:
+        error_exit("Unable to connect to the master at %s:%d." % address, exception=e)
+    if client.job is None:
+        return  # every job was already taken
+
+    args, seed, filename, data = client.job
+    if data is None:
+        # a local worker, started by the master
+        args.inputfile = open(filename, 'rb')
+        args.inputfile.close()  # (as parse_args() leaves it)
+        run_enumerator(utils.Statistics(), args, client, seed)
+        return
+
+    # The master sent the input itself: store it under the same name (so its
+    # type is detected the same way).
+    fd, filename = shared_tempfile('-' + os.path.basename(filename))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    args.inputfile = open(filename, 'rb')
+    args.inputfile.close()
+
+    # The enumerator exits its process directly when told to terminate, so
+    # run it in a child process, leaving this one to remove the file on exit.
+    proc = multiprocessing.Process(target=run_enumerator, args=(utils.Statistics(), args, client, seed))
+    proc.start()
+    proc.join()
+
+
+def input_filetype(args):
+    filename = args.inputfile.name
+    if args.cnf or filename.endswith(('.cnf', '.cnf.gz', '.gcnf', '.gcnf.gz')):
+        return 'cnf'
+    elif args.smt or filename.endswith('.smt2'):
+        return 'smt'
+    else:
+        return None
+
+
+class EnumeratorThread(threading.Thread):
+    '''A child enumerator run as a thread of this process (--backend threads),
+    providing the parts of the multiprocessing.Process interface used here.
+    '''
+    def __init__(self, pipe, **kwargs):
+        super(EnumeratorThread, self).__init__(**kwargs)
+        self.daemon = True  # don't hold up exiting (e.g., on a timeout)
+        self._pipe = pipe   # the master's end of the child's pipe
+
+    def terminate(self):
+        # a thread can't be killed, so tell it to stop
+        self._pipe.send('terminate')
+
+
+def load_clausedb(filename, cache=False):
+    '''Parse a CNF/GCNF instance (or load its cached image, if cache is True).'''
+    try:
+        if cache:
+            return dimacs.read_cached(filename)
+        return dimacs.read_dimacs(filename)
+    except (IOError, OSError, ValueError) as e:
+        error_exit("Unable to parse input file.", exception=e)
+
+
+def share_clausedb(filename, cache=False):
+    '''Parse a CNF/GCNF instance and write its binary image to a temporary
+    file (in shared memory, where available).  Children map that file
+    (see setup_csolver()), sharing its pages instead of each parsing and
+    storing its own copy of the instance.
+
+    If cache is True, the instance's cached image is used (and built first,
+    if needed) in place of a temporary file.
+
+    Returns the path of the file.  A temporary file is removed when this
+    process exits.
+    '''
+    db = load_clausedb(filename, cache)
+    if db.image is not None:
+        return db.image
+
+    fd, path = shared_tempfile('.cdb')
+    with os.fdopen(fd, 'wb') as f:
+        db.write_image(f)
+    return path
+
+
+def shared_tempfile(suffix):
+    '''Create a temporary file (in shared memory, where available) to be
+    removed when this process exits.  Returns an open fd and its path.'''
+    shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    fd, path = tempfile.mkstemp(prefix='marco-', suffix=suffix, dir=shm_dir)
+    atexit.register(os.remove, path)
+    return fd, path
 
 
 def setup_csolver(args, seed, n_only=False):
     filename = args.inputfile.name
 
     # create appropriate constraint solver
-    if args.cnf or filename.endswith(('.cnf', '.cnf.gz', '.gcnf', '.gcnf.gz')):
+    filetype = input_filetype(args)
+    if filetype == 'cnf':
         if args.force_minisat or args.mcs_only:  # mcs_only doesn't care about fancy features, give it a plain MinisatSubsetSolver
             solverclass = CNFsolvers.MinisatSubsetSolver
         elif args.improved_implies:
@@ -272,13 +562,21 @@ def setup_csolver(args, seed, n_only=False):
             extra_args = {}
             if args.mcs_only:
                 extra_args['store_dimacs'] = True
+            if getattr(args, 'clausedb', None) is not None:
+                # instance already parsed by the main thread
+                extra_args['clausedb'] = args.clausedb
+            elif getattr(args, 'clausedb_file', None):
+                # instance already parsed by the parent process
+                extra_args['clausedb'] = dimacs.load_image(args.clausedb_file)
+            elif args.cache and not n_only:
+                extra_args['clausedb'] = dimacs.read_cached(filename)
             csolver = solverclass(filename, seed, n_only, **extra_args)
         except utils.ExecutableException as e:
             error_exit("Unable to use MUSer2 for MUS extraction.", "Use --force-minisat to use Minisat instead (NOTE: it will be much slower.)", e)
         except (IOError, OSError) as e:
             error_exit("Unable to load pyminisolvers library.", "Run 'make -C src/pyminisolvers' to compile the library.", e)
 
-    elif args.smt or filename.endswith('.smt2'):
+    elif filetype == 'smt':
         try:
             from .SMTsolvers import Z3SubsetSolver
         except ImportError as e:
@@ -291,7 +589,7 @@ def setup_csolver(args, seed, n_only=False):
     return csolver
 
 
-def setup_msolver(n, args, seed=None):
+def setup_msolver(n, args, seed=None, stats=None):
     # create appropriate map solver
     if args.nomax:
         varbias = None  # will get a "random" seed from the Map solver
@@ -299,26 +597,35 @@ def setup_msolver(n, args, seed=None):
         varbias = (args.bias == 'MUSes')  # High bias (True) for MUSes, low (False) for MCSes
 
     try:
-        msolverclass = mapsolvers.MinisatMapSolver
+        if args.smallest:
+            # Seeds of minimum (maximum) size, with the bias reversed: each
+            # unsat (sat) one is then a MUS (MSS), found in order of size.
+            msolver = mapsolvers.MinicardMapSolver(n, bias=not varbias, rand_seed=seed, dump=args.dump_map)
+        else:
+            msolver = mapsolvers.MinisatMapSolver(n, bias=varbias, rand_seed=seed, dump=args.dump_map)
         if args.parallel:
-            # Synchronize if running in parallel mode
-            msolverclass = utils.synchronize_class(msolverclass)
-        msolver = msolverclass(n, bias=varbias, rand_seed=seed, dump=args.dump_map)
+            # Accept blocking clauses from the receiving thread if running in parallel mode
+            msolver = mapsolvers.ConcurrentMapSolver(msolver, stats)
     except OSError as e:
         error_exit("Unable to load pyminisolvers library.", "Run 'make -C src/pyminisolvers' to compile the library.", e)
 
     return msolver
 
 
-def setup_solvers(args, seed=None):
+def setup_solvers(args, seed=None, stats=None):
     csolver = setup_csolver(args, seed)
-    msolver = setup_msolver(csolver.n, args, seed)
+    msolver = setup_msolver(csolver.n, args, seed, stats)
 
     try:
         csolver.set_msolver(msolver)
     except AttributeError:
         pass
 
+    try:
+        csolver.set_stats(stats)
+    except AttributeError:
+        pass
+
     return (csolver, msolver)
 
 
@@ -326,6 +633,14 @@ def get_config(args):
     config = {}
     config['bias'] = args.bias
     config['comms_ignore'] = args.comms_ignore
+    config['comms_log'] = None  # a utils.ResultLog to read results from, if used
+    config['threaded'] = (args.backend == 'threads')
+    config['partition'] = bool(args.partition)
+    config['adaptive'] = args.adaptive
+    config['mcs_rebuild'] = args.mcs_rebuild
+    config['mcs_strategy'] = args.mcs_strategy
+    config['smallest'] = args.smallest
+    config['seed_batch'] = args.seed_batch
     if args.nomax:
         config['maximize'] = False
     else:
@@ -336,14 +651,20 @@ def get_config(args):
 
 
 def run_enumerator(stats, args, pipe, seed=None):
-    # Register interrupt handler to cleanly exit if receiving SIGTERM
-    # (probably from parent process)
-    def handler(signum, frame):  # pylint: disable=unused-argument
-        os._exit(0)
-    signal.signal(signal.SIGTERM, handler)  # external termination
+    if args.backend != 'threads':
+        # Register interrupt handler to cleanly exit if receiving SIGTERM
+        # (probably from parent process)
+        def handler(signum, frame):  # pylint: disable=unused-argument
+            os._exit(0)
+        signal.signal(signal.SIGTERM, handler)  # external termination
 
-    csolver, msolver = setup_solvers(args, seed)
+    if args.comms_batch:
+        pipe = utils.ResultBatcher(pipe, args.comms_batch, args.comms_batch_window)
+
+    csolver, msolver = setup_solvers(args, seed, stats)
     config = get_config(args)
+    if args.result_log_file:
+        config['comms_log'] = utils.ResultLog(args.result_log_file, args.child_id)
 
     if args.mcs_only:
         enumerator = MCSEnumerator(csolver, stats, config, pipe)
@@ -352,8 +673,17 @@ def run_enumerator(stats, args, pipe, seed=None):
 
     # enumerate results in a separate thread so signal handling works while in C code
     # ref: https://thisismiller.github.io/blog/CPython-Signal-Handling/
+    compact = resultcodec.compact_by_default(args.backend == 'tcp')
+
     def enumerate():
         for result in enumerator.enumerate():
+            if result[0] in ['U', 'S']:
+                # send the result encoded (canonically, so the master can
+                # filter duplicates), compactly if that pays off
+                if compact:
+                    result = (result[0], resultcodec.encode(result[1], csolver.n))
+                else:
+                    result = (result[0], resultcodec.encode_raw(result[1]))
             pipe.send(result)
 
     enumthread = threading.Thread(target=enumerate)
@@ -362,116 +692,275 @@ def run_enumerator(stats, args, pipe, seed=None):
     enumthread.join()
 
 
-def run_master(stats, args, pipes):
-    csolver = setup_csolver(args, seed=None, n_only=True)  # just parse enough to get n (#constraints)
-    is_parallel = len(pipes) > 1
+def run_master(stats, args, children, info):
+    n = info.n  # number of constraints, as probed from the input
+    if n is None:
+        # not determined by the probe; fall back to loading the constraints
+        n = setup_csolver(args, seed=None, n_only=True).n
+    is_parallel = len(args.parallel.split(',')) > 1
+    pipes = children.pipes
 
+    msolver = None
     if is_parallel:
         # for filtering duplicate results (found near-simultaneously by 2+ children)
-        # and spurious results (if using improved-implies and a child reaches a point that
-        # suddenly becomes blocked by new blocking clauses, it could return that incorrectly
-        # as an MUS or MCS)
-        msolver = mapsolvers.MinisatMapSolver(csolver.n)
-        # Old way: results = set()
+        results = set()
+        if args.improved_implies:
+            # and for filtering spurious results (if using improved-implies and a child
+            # reaches a point that suddenly becomes blocked by new blocking clauses, it
+            # could return that incorrectly as an MUS or MCS)
+            msolver = mapsolvers.MinisatMapSolver(n)
+
+    log = None
+    if args.result_log_file:
+        # results go to the children through a shared log, tagged with their source
+        log = utils.ResultLog(args.result_log_file)
+
+    latest = {}  # the most recent pipe from each child (which may reconnect, with tcp)
+
+    scheduler = None
+    if args.partition:
+        # hand out parts of the search space to the children (see partition.py)
+        scheduler = partition.CubeScheduler(n, args.partition, stats)
+
+    rebalancer = None
+    adaptive_log_file = None
+    if args.adaptive:
+        # switch the bias of unproductive children (see portfolio.py)
+        biases = {i: mode == 'MUS' for i, mode in enumerate(args.parallel.split(',')) if mode in ('MUS', 'MCS')}
+        if args.adaptive_log:
+            # (closed when the master finishes, below)
+            adaptive_log = adaptive_log_file = open(args.adaptive_log, 'w')
+        else:
+            adaptive_log = sys.stderr if args.verbose > 1 else None
+        rebalancer = portfolio.Rebalancer(biases, args.adaptive, stats, adaptive_log)
+
+    # to report each child's rate of duplicate results
+    received = collections.Counter()
+    duplicates = collections.Counter()
+
+    def record_child_stats():
+        for child in sorted(received):
+            stats.add_stat("duplicate rate (child %d)" % child, duplicates[child] / float(received[child]))
+        for child in sorted(latest):
+            if latest[child].dropped:
+                # results not forwarded to a child that fell behind (see transport.QueuedConnection)
+                stats.add_stat("results dropped (child %d)" % child, latest[child].dropped)
+        if log is not None and log.dropped:
+            # results overwritten before every child read them (see utils.ResultLog)
+            stats.add_stat("results dropped (log)", log.dropped)
+
+    def remove_child(pipe):
+        # stop listening to a child that has closed its connection or died
+        children.remove(pipe)
+        child = children.child_id(pipe)
+        if scheduler is not None and latest.get(child) is pipe:
+            # hand its cube to another child
+            for other, msg in scheduler.remove(child):
+                latest[other].send(msg)
 
     remaining = args.limit
+    if args.smallest:
+        # the results wanted in order of size (see setup_msolver())
+        smallest_type = 'U' if args.parallel == 'MUS' else 'S'
+        smallest_remaining = args.smallest
 
-    while multiprocessing.active_children() and pipes:
-        ready, _, _ = select.select(pipes, [], [])
-        with stats.time('hubcomms'):
-            for receiver in ready:
-                while receiver.poll():
-                    try:
-                        # get a result
-                        result = receiver.recv()
-                    except EOFError:
-                        # Sometimes a closed pipe will still trigger ready and .poll(),
-                        # but it then throws an EOFError on .recv().  Handle that here.
-                        pipes.remove(receiver)
-                        break
-
-                    if result[0] == 'done':
-                        # "done" indicates the child process has finished its work,
-                        # but enumeration may not be complete (if the child was only
-                        # enumerating MCSes, e.g.)
-                        if args.verbose > 1:
-                            print("Child (%s) sent 'done'." % receiver)
-                        # Terminate the child process.
-                        receiver.send('terminate')
-                        # Remove it from the list of active pipes
-                        pipes.remove(receiver)
-
-                    elif result[0] == 'complete':
-                        # "complete" indicates the child process has completed enumeration,
-                        # with everything blocked.  Everything can be stopped at this point.
-                        if args.verbose > 1:
-                            print("Child (%s) sent 'complete'." % receiver)
-
-                        # TODO: print children's results, but differentiate somehow...
-                        #if args.stats:
-                        #    # Print received stats
-                        #    at_exit(result[1])
-
-                        # End / cleanup all children
-                        for pipe in pipes:
-                            pipe.send('terminate')
-
-                        return
-
-                    else:
-                        assert result[0] in ['U', 'S']
-
-                        if is_parallel:
-                            # filter out duplicate / spurious results
-                            with stats.time('msolver'):
-                                if not msolver.check_seed(result[1]):
-                                    if args.verbose > 1:
-                                        print("Child (%s) sent duplicate (len: %d)" % (receiver, len(result[1])))
-                                    if result[0] == 'U':
-                                        stats.increment_counter("duplicate MUS")
-                                    else:
-                                        stats.increment_counter("duplicate MSS")
-
-                                    # already found/reported/explored
-                                    continue
-
-                            with stats.time('msolver_block'):
-                                if result[0] == 'U':
-                                    msolver.block_up(result[1])
-                                elif result[0] == 'S':
-                                    msolver.block_down(result[1])
-
-                            # Old way to check duplicates:
-                            #res_set = frozenset(result[1])
-                            #res_set = ",".join(str(x) for x in result[1])
-                            #if res_set in results:
-                            #    continue
-                            #
-                            #results.add(res_set)
-
-                        yield result, csolver.n
-
-                        if remaining:
-                            remaining -= 1
-                            if remaining == 0:
-                                sys.stderr.write("Result limit reached.\n")
-                                # End / cleanup all children
+    try:
+        while children.active():
+            ready = children.wait()
+            with stats.time('hubcomms'):
+                for receiver in ready:
+                    child = children.child_id(receiver)
+                    latest[child] = receiver
+                    while receiver.poll():
+                        try:
+                            # get a result
+                            result = receiver.recv()
+                        except EOFError:
+                            # Sometimes a closed pipe will still trigger ready and .poll(),
+                            # but it then throws an EOFError on .recv().  Handle that here.
+                            remove_child(receiver)
+                            break
+
+                        if result[0] == 'done':
+                            # "done" indicates the child process has finished its work,
+                            # but enumeration may not be complete (if the child was only
+                            # enumerating MCSes, e.g.)
+                            if args.verbose > 1:
+                                print("Child (%s) sent 'done'." % receiver)
+                            # the SAT calls an MCS-only child needed (see --mcs-strategy)
+                            stats.add_stat("MCS SAT calls (child %d)" % child, result[1].get_counts().get('solve', 0))
+                            # Terminate the child process.
+                            receiver.send('terminate')
+                            # Remove it from the list of active pipes
+                            children.remove(receiver)
+
+                        elif result[0] == 'complete':
+                            # "complete" indicates the child process has completed enumeration,
+                            # with everything blocked.  Everything can be stopped at this point.
+                            if args.verbose > 1:
+                                print("Child (%s) sent 'complete'." % receiver)
+
+                            # TODO: print children's results, but differentiate somehow...
+                            #if args.stats:
+                            #    # Print received stats
+                            #    at_exit(result[1])
+
+                            # End / cleanup all children
+                            for pipe in pipes:
+                                pipe.send('terminate')
+
+                            record_child_stats()
+                            return
+
+                        elif result[0] == 'idle':
+                            # the child has explored all of its cube
+                            for other, msg in scheduler.idle(child, result[1]):
+                                latest[other].send(msg)
+
+                            if scheduler.finished():
+                                # every cube has been explored, so enumeration is complete
+                                if args.verbose > 1:
+                                    print("All cubes explored.")
                                 for pipe in pipes:
                                     pipe.send('terminate')
 
+                                record_child_stats()
                                 return
 
-                        if not args.comms_disable:
-                            # send it to all children *other* than the one we got it from
-                            for other in pipes:
-                                if other != receiver:
-                                    other.send(result)
+                        elif result[0] == 'pause':
+                            # the child is falling behind on results; hold them until it catches up
+                            stats.increment_counter("pause requests")
+                            receiver.pause()
+
+                        elif result[0] == 'resume':
+                            receiver.resume()
+
+                        elif result[0] == 'stats':
+                            # times reported for rebalancing
+                            rebalancer.report(child, result[1])
+
+                        else:
+                            if result[0] == 'B':
+                                # a batch of results (see utils.ResultBatcher)
+                                stats.add_stat("batch size", len(result[1]))
+                                stats.add_stat("hub latency", time.time() - result[2])
+
+                            accepted = []
+                            for res in utils.unbatch(result):
+                                assert res[0] in ['U', 'S']
+
+                                if is_parallel:
+                                    # filter out duplicate results
+                                    # (the encoding of a result is canonical, so it serves as an exact key)
+                                    with stats.time('dedup'):
+                                        duplicate = res in results
+                                        if not duplicate:
+                                            results.add(res)
+
+                                    received[child] += 1
+                                    if rebalancer is not None:
+                                        rebalancer.result(child, duplicate)
+                                    if duplicate:
+                                        duplicates[child] += 1
+                                        if args.verbose > 1:
+                                            print("Child (%s) sent duplicate (len: %d)" % (receiver, len(resultcodec.decode(res[1]))))
+                                        if res[0] == 'U':
+                                            stats.increment_counter("duplicate MUS")
+                                        else:
+                                            stats.increment_counter("duplicate MSS")
+
+                                        # already found/reported
+                                        continue
+
+                                decoded = (res[0], resultcodec.decode(res[1]))
+
+                                if msolver is not None:
+                                    # filter out spurious results
+                                    with stats.time('msolver'):
+                                        if not msolver.check_seed(decoded[1]):
+                                            if args.verbose > 1:
+                                                print("Child (%s) sent spurious result (len: %d)" % (receiver, len(decoded[1])))
+                                            if res[0] == 'U':
+                                                stats.increment_counter("spurious MUS")
+                                            else:
+                                                stats.increment_counter("spurious MSS")
+
+                                            # already explored
+                                            continue
+
+                                    with stats.time('msolver_block'):
+                                        if res[0] == 'U':
+                                            msolver.block_up(decoded[1])
+                                        elif res[0] == 'S':
+                                            msolver.block_down(decoded[1])
+
+                                yield decoded, n
+
+                                if args.smallest and res[0] == smallest_type:
+                                    smallest_remaining -= 1
+                                    if smallest_remaining == 0:
+                                        if args.verbose > 1:
+                                            print("Found the %d smallest." % args.smallest)
+                                        # End / cleanup all children
+                                        for pipe in pipes:
+                                            pipe.send('terminate')
+
+                                        record_child_stats()
+                                        return
+
+                                if remaining:
+                                    remaining -= 1
+                                    if remaining == 0:
+                                        sys.stderr.write("Result limit reached.\n")
+                                        # End / cleanup all children
+                                        for pipe in pipes:
+                                            pipe.send('terminate')
+
+                                        record_child_stats()
+                                        return
+
+                                accepted.append(res)
+
+                            if accepted and log is not None:
+                                with stats.time('log'):
+                                    waiting = log.append(accepted, child)
+                                    # wake the children waiting for more (see utils.incoming())
+                                    for other in pipes:
+                                        if children.child_id(other) in waiting:
+                                            other.send('log')
+
+                            elif accepted and not args.comms_disable:
+                                # send them to all children *other* than the one we got them from
+                                if result[0] == 'B':
+                                    forward = ('B', accepted, result[2])
+                                else:
+                                    forward = accepted[0]
+                                for other in pipes:
+                                    if other != receiver:
+                                        other.send(forward)
+
+                for pipe in children.lost():
+                    # a child died without closing its connection (or, with tcp,
+                    # never reconnected)
+                    if args.verbose > 1:
+                        print("Child (%s) lost." % pipe)
+                    stats.increment_counter("children lost")
+                    remove_child(pipe)
+
+                if rebalancer is not None:
+                    for other, msg in rebalancer.rebalance():
+                        latest[other].send(msg)
+
+        record_child_stats()
+    finally:
+        if adaptive_log_file is not None:
+            adaptive_log_file.close()
 
 
 def print_result(result, args, stats, num_constraints):
     if result[0] == 'S' and args.print_mcses:
         # MCS = the complement of the MSS relative to the full set of constraints
-        result = ('C', set(range(1, num_constraints+1)).difference(result[1]))
+        result = ('C', resultcodec.complement(result[1], num_constraints))
     output = result[0]
     if args.alltimes:
         output = "%s %0.3f" % (output, stats.total_time())
@@ -496,34 +985,86 @@ def enumerate_with_args(args, print_results=False):
     can be called (`gen.close()`) to terminate the enumeration at any point.
     '''
 
+    stats, children, info = start_enumeration(args)
+    if children is not None:
+        yield from collect_results(stats, args, children, info, print_results)
+
+
+async def enumerate_with_args_async(args, print_results=False):
+    '''Enumerate results asynchronously: an asynchronous generator version
+    of enumerate_with_args(), for use with asyncio (e.g., `async for result
+    in enumerate_with_args_async(args)`).
+
+    The master's loop runs in a separate thread, so waiting for results never
+    blocks the event loop.  The generator's .aclose() method terminates the
+    enumeration, like .close() for enumerate_with_args().  (Setup, including
+    installing signal handlers, runs in the calling thread, which should be
+    the main thread.)
+    '''
+    stats, children, info = start_enumeration(args)
+    if children is None:
+        return
+
+    loop = asyncio.get_running_loop()
+    results = collect_results(stats, args, children, info, print_results)
+    # one thread, so closing the generator waits for any next() in progress
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    finished = object()
+    try:
+        while True:
+            result = await loop.run_in_executor(executor, next, results, finished)
+            if result is finished:
+                return
+            yield result
+    finally:
+        executor.submit(results.close)
+        executor.shutdown(wait=False)
+
+
+def start_enumeration(args):
+    '''Check arguments and start the children.
+
+    Returns:
+        (stats, children, info), with children None if no enumeration is
+        needed (--limit 0).
+    '''
     stats = utils.Statistics()
 
     with stats.time('setup'):
-        check_args(args)
+        info = check_args(args)
         setup_execution(args, stats, os.getpid())
-        pipes, procs = setup_parallel(args, stats)
+        children = setup_parallel(args, stats)
 
     # useful for timing just the parsing / setup
     if args.limit == 0:
-        return
+        return stats, None, info
 
-    for proc in procs:
-        proc.start()
+    children.start()
+    return stats, children, info
 
-    for result, n in run_master(stats, args, pipes):
-        try:
-            if print_results:
-                yield print_result(result, args, stats, n)
-            else:
-                yield result
-        except GeneratorExit:
-            # Handle a .close() call on the generator
-            for proc in procs:
-                proc.terminate()
-            return
+
+def collect_results(stats, args, children, info, print_results=False):
+    '''Yield the master's results from started children (see
+    enumerate_with_args()).'''
+    try:
+        for result, n in run_master(stats, args, children, info):
+            try:
+                if print_results:
+                    yield print_result(result, args, stats, n)
+                else:
+                    yield result
+            except GeneratorExit:
+                # Handle a .close() call on the generator
+                children.terminate()
+                return
+    finally:
+        children.close()
 
 
 def main():
     args = parse_args()
+    if args.connect:
+        connect_worker(args)
+        return
     for result in enumerate_with_args(args, print_results=True):
         print(result)
@@ -0,0 +1,163 @@
+"""Partitioning the space of seeds between parallel children.
+
+The power set of the constraints is split into cubes: each cube fixes some
+constraints in (i) or out (-i) of every seed, and a child only takes seeds
+from its current cube (see MapSolver.set_cube()).  Results are still shared
+and blocked everywhere as usual; a cube only restricts where a child
+*starts* its search, so children start in different places rather than all
+racing toward the same results.
+
+The master's CubeScheduler hands out cubes to children as they become idle.
+Once all cubes are handed out, an idle child steals half of another child's
+cube: that cube is split on one more constraint, narrowing the current
+owner's cube to one half and giving the other half to the idle child.
+"""
+import collections
+import queue
+
+# How many constraints past the initial depth a cube may be split on by
+# steals.  Late in a run, most of a busy child's cube is usually explored
+# already, so halves stolen from it are often empty; this bounds the number
+# of such steals (to at most 2**(depth + STEAL_DEPTH) cubes in all).
+STEAL_DEPTH = 4
+
+
+def split_order(n, depth):
+    """Order in which to split on constraints: `depth` evenly spaced
+    constraints first, then all others in increasing order."""
+    first = sorted(set(1 + (i * n) // depth for i in range(depth)))
+    rest = sorted(set(range(1, n+1)).difference(first))
+    return first + rest
+
+
+class CubeScheduler(object):
+    """The master's record of which child is working on which cube.
+
+    Each cube is a prefix of split_order() with a sign for each constraint,
+    so it can be split on the next constraint in that order (up to
+    STEAL_DEPTH constraints past the initial depth).  Cubes
+    are handed out with increasing IDs; a cube narrowed by a steal keeps its
+    ID, so a child can always tell a narrowing of its current cube from a
+    stale message about an earlier one.
+
+    Args:
+        n: The number of constraints.
+        depth: Split into 2**depth cubes to start.
+        stats: A Statistics object in which to count steals (optional).
+    """
+    def __init__(self, n, depth, stats=None):
+        depth = min(depth, n)
+        self._order = split_order(n, depth)
+        self._max_len = min(n, depth + STEAL_DEPTH)
+        self._pending = collections.deque([[]])
+        for var in self._order[:depth]:
+            self._pending = collections.deque(cube + [lit] for cube in self._pending for lit in (var, -var))
+        self._assigned = {}  # child -> [cube ID, cube]
+        self._waiting = []   # idle children, waiting for a cube
+        self._next_id = 0
+        self._stats = stats
+
+    def finished(self):
+        """True if every cube has been explored."""
+        return not self._pending and not self._assigned
+
+    def idle(self, child, cube_id):
+        """Record that a child has exhausted its cube (cube_id None if it
+        had none yet), and hand out work.
+
+        Returns:
+            A list of (child, message) pairs to send.
+        """
+        current = self._assigned.get(child)
+        if current is not None and current[0] == cube_id:
+            del self._assigned[child]
+        self._waiting.append(child)
+        return self._dispatch()
+
+    def remove(self, child):
+        """Return a child's cube (if any) to the pool, e.g. if it has exited."""
+        current = self._assigned.pop(child, None)
+        if current is not None:
+            self._pending.appendleft(current[1])
+        if child in self._waiting:
+            self._waiting.remove(child)
+        return self._dispatch()
+
+    def _dispatch(self):
+        messages = []
+        while self._waiting:
+            if self._pending:
+                cube = self._pending.popleft()
+            else:
+                cube = self._steal(messages)
+                if cube is None:
+                    break  # nothing left to split; wait for everything to finish
+            child = self._waiting.pop(0)
+            self._assigned[child] = [self._next_id, cube]
+            messages.append((child, ('cube', self._next_id, cube)))
+            self._next_id += 1
+        return messages
+
+    def _steal(self, messages):
+        # split the largest cube still being explored
+        victims = [child for child, (_, cube) in self._assigned.items() if len(cube) < self._max_len]
+        if not victims:
+            return None
+        victim = min(victims, key=lambda child: (len(self._assigned[child][1]), self._assigned[child][0]))
+        cube_id, cube = self._assigned[victim]
+        var = self._order[len(cube)]
+        self._assigned[victim] = [cube_id, cube + [var]]
+        messages.append((victim, ('cube', cube_id, cube + [var])))
+        if self._stats is not None:
+            self._stats.increment_counter("cubes stolen")
+        return cube + [-var]
+
+
+class CubeClient(object):
+    """A child's end of the partitioning: keeps its map solver restricted to
+    the cube it was most recently assigned.
+
+    Cube messages from the master are passed in by the receiving thread
+    (receive()) and applied by the enumerating thread (update() and
+    next_cube()), so only the enumerating thread touches the map solver.
+    """
+    def __init__(self, msolver, pipe):
+        self.map = msolver
+        self.pipe = pipe
+        self.cube_id = -1  # no cube yet
+        self._incoming = queue.Queue()
+
+    def receive(self, msg):
+        """Pass in a ('cube', ID, cube) message, or None to stop waiting."""
+        self._incoming.put(msg)
+
+    def update(self):
+        """Apply any narrowing of the current cube (from a steal)."""
+        while not self._incoming.empty():
+            msg = self._incoming.get()
+            if msg is not None:
+                self._apply(msg)
+
+    def next_cube(self):
+        """Report the current cube exhausted and wait for another.
+
+        Returns:
+            True if a new cube was assigned, False if told to stop.
+        """
+        self.pipe.send(('idle', None if self.cube_id < 0 else self.cube_id))
+        while True:
+            msg = self._incoming.get()
+            if msg is None:
+                return False
+            if self._apply(msg):
+                return True
+
+    def _apply(self, msg):
+        # returns True if msg assigns a new cube
+        _, cube_id, cube = msg
+        if cube_id < self.cube_id:
+            return False  # a narrowing of a cube already finished
+        new = (cube_id > self.cube_id)
+        self.cube_id = cube_id
+        self.map.set_cube(cube)
+        return new
@@ -0,0 +1,162 @@
+"""Adaptive rebalancing of the bias of parallel children.
+
+With --adaptive, each MUS- or MCS-biased child periodically reports the
+time it has spent in shrink() and grow() (as a ('stats', times) message),
+and the master's Rebalancer combines those with the results it has received
+from each child.  Once per window (every --adaptive seconds), it measures
+for each child:
+  yield:      new (non-duplicate) results per second
+  duplicates: the fraction of its results already found by another child
+  effort:     the fraction of its time spent in the step its bias does not
+              help with (shrink() for a MUS bias, grow() for a MCS bias)
+and may switch the bias of one child, sending it a ('bias', bias) message
+(see MapSolver.set_bias()).
+
+A child is switched if its yield is well below (by a factor of HYSTERESIS)
+the average yield of the children with the other bias, or, if no child has
+the other bias, if it is spending most of its time in the expensive step
+and finding mostly duplicates.  Only the child with the lowest yield is
+considered, and not within COOLDOWN windows of its last switch, so the
+portfolio does not thrash between configurations.
+"""
+import collections
+import time
+
+# A child's bias is only switched if the other bias yields this many times
+# more results per second...
+HYSTERESIS = 1.5
+# ...and not within this many windows of its last switch.
+COOLDOWN = 2
+# With no child of the other bias to compare to, a child is switched if at
+# least this fraction of its results are duplicates and of its time is spent
+# in the expensive step.
+STUCK = 0.5
+
+_names = {True: "MUS", False: "MCS"}
+
+
+class Rebalancer(object):
+    """The master's record of each adjustable child's yield.
+
+    Args:
+        biases: A dict mapping each adjustable child (by ID) to its initial
+                bias (True for MUSes, False for MCSes).
+        interval: The length of a window, in seconds.
+        stats: A Statistics object in which to count switches (optional).
+        log: A file to which to write each decision (optional).
+    """
+    def __init__(self, biases, interval, stats=None, log=None):
+        self.biases = dict(biases)
+        self.interval = interval
+        self._stats = stats
+        self._log = log
+        self._start = self._last = time.time()
+        self._window = 0
+        self._results = collections.Counter()
+        self._duplicates = collections.Counter()
+        self._times = {}       # child -> most recently reported times
+        self._prev_times = {}  # child -> times reported before this window
+        self._switched = {}    # child -> window in which it was last switched
+
+    def result(self, child, duplicate):
+        """Record a result received from a child."""
+        if child in self.biases:
+            self._results[child] += 1
+            if duplicate:
+                self._duplicates[child] += 1
+
+    def report(self, child, times):
+        """Record the times (a dict of totals, by category) reported by a child."""
+        if child in self.biases:
+            self._times[child] = times
+
+    def rebalance(self, now=None):
+        """End the current window, if it has run its length, and decide
+        whether to switch a child's bias.
+
+        Returns:
+            A list of (child, message) pairs to send.
+        """
+        if now is None:
+            now = time.time()
+        elapsed = now - self._last
+        if elapsed < self.interval or not self.biases:
+            return []
+
+        # (only children that have reported are running yet)
+        measures = {child: self._measure(child, elapsed) for child in self.biases if child in self._times}
+        if not measures:
+            return []
+        child, reason = self._decide(measures)
+
+        self._write("%.2f s, window %d:" % (now - self._start, self._window))
+        for other in sorted(measures):
+            self._write("  child %d (%s): %s" % (other, _names[self.biases[other]], _describe(measures[other], self.biases[other])))
+
+        messages = []
+        if child is None:
+            self._write("  keep: %s" % reason)
+        else:
+            bias = not self.biases[child]
+            self._write("  switch child %d to %s bias: %s" % (child, _names[bias], reason))
+            self.biases[child] = bias
+            self._switched[child] = self._window
+            messages.append((child, ('bias', bias)))
+            if self._stats is not None:
+                self._stats.increment_counter("bias switches")
+
+        self._last = now
+        self._window += 1
+        self._results.clear()
+        self._duplicates.clear()
+        self._prev_times.update(self._times)
+        return messages
+
+    def _measure(self, child, elapsed):
+        # (yield, duplicate rate, effort) for one child over the current window
+        results = self._results[child]
+        duplicates = self._duplicates[child]
+        dup_rate = duplicates / float(results) if results else 0.0
+
+        effort = None  # unknown if the child has not reported since the last window
+        times = self._times[child]
+        prev = self._prev_times.get(child, {})
+        expensive = 'shrink' if self.biases[child] else 'grow'
+        total = times['total'] - prev.get('total', 0.0)
+        if total > 0:
+            effort = (times[expensive] - prev.get(expensive, 0.0)) / total
+
+        return (results - duplicates) / elapsed, dup_rate, effort
+
+    def _decide(self, measures):
+        # returns (child to switch or None, reason)
+        candidates = [child for child in measures if self._window - self._switched.get(child, -COOLDOWN) >= COOLDOWN]
+        if not candidates:
+            return None, "every child was switched recently"
+
+        # the child with the lowest yield (breaking ties by most duplicates, then most effort)
+        child = min(candidates, key=lambda c: (measures[c][0], -measures[c][1], -(measures[c][2] or 0.0)))
+        yield_, dup_rate, effort = measures[child]
+        other = [c for c in measures if self.biases[c] != self.biases[child]]
+
+        if other:
+            other_yield = sum(measures[c][0] for c in other) / len(other)
+            if other_yield > 0 and yield_ * HYSTERESIS < other_yield:
+                return child, "%.1f results/s vs. %.1f results/s with %s bias" % (yield_, other_yield, _names[not self.biases[child]])
+            return None, "the lowest yield of any child not switched recently (child %d, %.1f results/s) is not far below %.1f results/s with %s bias" % (child, yield_, other_yield, _names[not self.biases[child]])
+
+        if effort is not None and dup_rate >= STUCK and effort >= STUCK:
+            return child, "no child has %s bias, and this one is mostly finding duplicates and in %s()" % (_names[not self.biases[child]], 'shrink' if self.biases[child] else 'grow')
+        return None, "no child has %s bias, and the lowest-yield child (%d) is not stuck" % (_names[not self.biases[child]], child)
+
+    def _write(self, line):
+        if self._log is not None:
+            self._log.write(line + "\n")
+            self._log.flush()
+
+
+def _describe(measure, bias):
+    yield_, dup_rate, effort = measure
+    step = 'shrink' if bias else 'grow'
+    effort_text = "unreported" if effort is None else "%.0f%%" % (100 * effort)
+    return "%.1f results/s, %.0f%% duplicates, %s() %s of time" % (yield_, 100 * dup_rate, step, effort_text)
@@ -0,0 +1,165 @@
+"""Compact encoding of results (sets of 1-based constraint indexes) for
+sending between processes.
+
+Each result is encoded in whichever of two forms is smaller:
+  a sorted list of deltas between consecutive indexes, as LEB128 varints
+  (small results), or a bitset with bit i-1 set for each index i (large
+  results).
+Without NumPy, building either form takes a Python-level step per index,
+which costs more than it saves unless the result is sent over a network.
+So there is also a raw form (see encode_raw()): the sorted indexes as
+native ints, which are copied in bulk.
+The first byte of an encoded result gives its form.  The encoding of a set
+is canonical (it does not depend on the order of the given indexes), so
+encoded results can be compared and hashed directly.
+"""
+import array
+import itertools
+import operator
+
+# NumPy is optional.  If available, it is used to convert bitsets and deltas.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+VARINT = 0
+BITSET = 1
+RAW = 2
+
+_to_digits = bytes.maketrans(b"\x00\x01", b"01")
+_from_digits = bytes.maketrans(b"01", b"\x00\x01")
+
+
+def bitset_size(n):
+    """Size in bytes of an encoded bitset for n constraints."""
+    return 1 + (n + 7) // 8
+
+
+def encode(indexes, n):
+    """Encode a result (a collection of distinct indexes in 1..n)."""
+    if len(indexes) >= bitset_size(n):
+        # every index takes at least one byte as a varint
+        return encode_bitset(indexes, n)
+    data = encode_varint(indexes)
+    if len(data) > bitset_size(n):
+        return encode_bitset(indexes, n)
+    return data
+
+
+def compact_by_default(networked):
+    """Whether results should be sent in a compact form (encode()) rather
+    than raw (encode_raw()): if they go over a network, or if NumPy makes
+    encoding them cheap."""
+    return networked or numpy is not None
+
+
+def encode_raw(indexes):
+    """Encode a result in the raw form: a sorted array of native ints.
+    (Sorting keeps the encoding canonical, and costs little for the
+    already sorted results the solver library returns.)"""
+    return bytes([RAW]) + array.array('i', sorted(indexes)).tobytes()
+
+
+def encode_varint(indexes):
+    indexes = sorted(indexes)
+    deltas = list(map(operator.sub, indexes, [0] + indexes[:-1]))
+    if not deltas or max(deltas) < 0x80:
+        return bytes([VARINT]) + bytes(deltas)
+
+    data = bytearray([VARINT])
+    for delta in deltas:
+        while delta >= 0x80:
+            data.append((delta & 0x7f) | 0x80)
+            delta >>= 7
+        data.append(delta)
+    return bytes(data)
+
+
+def encode_bitset(indexes, n):
+    return bytes([BITSET]) + _to_bitset(indexes, n)
+
+
+def decode(data):
+    """Decode an encoded result.
+
+    Returns:
+        An array of the result's indexes, in increasing order.
+    """
+    if data[0] == BITSET:
+        return _from_bitset(data[1:])
+    if data[0] == RAW:
+        indexes = array.array('i')
+        indexes.frombytes(memoryview(data)[1:])
+        return indexes
+
+    if len(data) == 1 or max(data[1:]) < 0x80:
+        # every delta fits in one byte
+        if numpy is not None:
+            return _from_numpy(numpy.cumsum(numpy.frombuffer(data, dtype=numpy.uint8, offset=1), dtype=numpy.int32))
+        return array.array('i', itertools.accumulate(data[1:]))
+
+    indexes = array.array('i')
+    value = 0
+    delta = 0
+    shift = 0
+    for byte in data[1:]:
+        delta |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            value += delta
+            indexes.append(value)
+            delta = 0
+            shift = 0
+    return indexes
+
+
+def complement(indexes, n):
+    """Return the indexes in 1..n *not* in the given result (which may be an
+    encoded result or a collection of indexes), in increasing order."""
+    if isinstance(indexes, bytes) and indexes[0] == BITSET:
+        bits = indexes[1:]
+    elif isinstance(indexes, bytes):
+        bits = _to_bitset(decode(indexes), n)
+    else:
+        bits = _to_bitset(indexes, n)
+    # flip every bit, leaving the padding in the last byte clear
+    inverted = int.from_bytes(bits, 'little') ^ ((1 << n) - 1)
+    return _from_bitset(inverted.to_bytes(len(bits), 'little'))
+
+
+def _to_bitset(indexes, n):
+    if numpy is not None:
+        flags = numpy.zeros(n, dtype=numpy.uint8)
+        flags[_to_numpy(indexes) - 1] = 1
+        return numpy.packbits(flags, bitorder='little').tobytes()
+
+    # set a flag byte for each index, then read the flags as binary digits
+    flags = bytearray(n)
+    for i in indexes:
+        flags[i-1] = 1
+    bits = int(flags[::-1].translate(_to_digits), 2) if n else 0
+    return bits.to_bytes((n + 7) // 8, 'little')
+
+
+def _from_bitset(bits):
+    if numpy is not None:
+        flags = numpy.unpackbits(numpy.frombuffer(bits, dtype=numpy.uint8), bitorder='little')
+        return _from_numpy(numpy.flatnonzero(flags) + 1)
+
+    # the binary digits, least significant first, as 0/1 selectors
+    selectors = bin(int.from_bytes(bits, 'little'))[:1:-1].encode().translate(_from_digits)
+    return array.array('i', itertools.compress(itertools.count(1), selectors))
+
+
+def _to_numpy(indexes):
+    if isinstance(indexes, array.array) and indexes.typecode == 'i':
+        return numpy.frombuffer(indexes, dtype=numpy.intc).astype(numpy.intp)
+    return numpy.fromiter(indexes, dtype=numpy.intp)
+
+
+def _from_numpy(values):
+    indexes = array.array('i')
+    indexes.frombytes(values.astype(numpy.intc).tobytes())
+    return indexes
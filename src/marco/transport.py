@@ -0,0 +1,501 @@
+"""Transports connecting the master (run_master()) to its children.
+
+Whatever the transport, the master sees one connection per child, each with
+the parts of the multiprocessing Connection interface used for pipes (send,
+recv, poll, and fileno), carrying the same messages.  Each is wrapped in a
+QueuedConnection, so that sending results to a slow child never holds up the
+master.
+"""
+import collections
+from multiprocessing import connection
+import os
+import queue
+import selectors
+import socket
+import struct
+import threading
+import time
+
+# At most this many results wait to be sent to each child (see QueuedConnection).
+SEND_QUEUE_LIMIT = 1000
+
+# wait() returns at least this often (in seconds), so the master can check
+# on its children (see active() and lost()).
+HEALTH_INTERVAL = 1.0
+
+# A TCPHub acknowledges every this many messages received from a child, so
+# the child can stop keeping them for resending (see TCPClient).
+ACK_INTERVAL = 100
+
+# Seconds a connecting child has to complete the handshake with a TCPHub
+HANDSHAKE_TIMEOUT = 10.0
+
+
+def _set_timeout(conn, seconds):
+    """Set (or, with 0, clear) the timeout for each send or receive on a
+    connection's socket."""
+    timeval = struct.pack("ll", int(seconds), 0)
+    with socket.socket(fileno=os.dup(conn.fileno())) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, timeval)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, timeval)
+
+
+def parse_address(text):
+    """Parse a 'HOST:PORT' string into a (host, port) address."""
+    host, _, port = text.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError("Invalid address (expected HOST:PORT): %s" % text)
+    return (host.strip('[]'), int(port))
+
+
+class QueuedConnection(object):
+    """The master's end of a connection to a child, wrapped so that sending
+    results never blocks the master.
+
+    Results ('U', 'S', and 'B' messages) are queued and sent by a separate
+    thread.  If `limit` results are already waiting (the child is not
+    keeping up), the oldest is dropped: results only help a child avoid
+    repeating work done elsewhere, and one it misses and then finds again is
+    filtered out by the master as a duplicate.  Other (control) messages are
+    sent right away.  Sending results can also be paused, at the child's
+    request, while it catches up (see pause()).  Everything else passes
+    through to the wrapped connection.
+    """
+    def __init__(self, conn, limit=SEND_QUEUE_LIMIT):
+        self._conn = conn
+        self._queue = collections.deque(maxlen=limit)
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()  # held while sending on conn
+        self._thread = None  # (started with the first result)
+        self._stopped = False
+        self._paused = False
+        self.dropped = 0  # results dropped
+
+    def send(self, msg):
+        if msg[0] not in ('U', 'S', 'B'):
+            with self._send_lock:
+                self._conn.send(msg)
+            return
+
+        with self._cond:
+            if self._stopped:
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._send_queued, daemon=True)
+                self._thread.start()
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(msg)
+            self._cond.notify()
+
+    def _send_queued(self):
+        while True:
+            with self._cond:
+                while (self._paused or not self._queue) and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                msg = self._queue.popleft()
+            try:
+                with self._send_lock:
+                    self._conn.send(msg)
+            except OSError:
+                self.stop()  # the child is gone
+
+    def pause(self):
+        """Hold results (dropping the oldest past the limit) until resume()."""
+        with self._cond:
+            self._paused = True
+
+    def resume(self):
+        with self._cond:
+            self._paused = False
+            self._cond.notify()
+
+    def stop(self):
+        """Stop sending queued results (dropping any still waiting)."""
+        with self._cond:
+            self._stopped = True
+            self._queue.clear()
+            self._cond.notify()
+
+    def close(self):
+        self.stop()
+        self._conn.close()
+
+    def recv(self):
+        return self._conn.recv()
+
+    def poll(self, timeout=0.0):
+        return self._conn.poll(timeout)
+
+    def fileno(self):
+        return self._conn.fileno()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class LocalTransport(object):
+    """Children started by this process (as processes or threads), each
+    connected to the master by a pipe.
+    """
+    def __init__(self, pipes, workers):
+        self.pipes = {}  # connection -> child ID, for each child still connected
+        self.workers = workers
+        self._selector = selectors.DefaultSelector()
+        for i, pipe in enumerate(pipes):
+            pipe = QueuedConnection(pipe)
+            self.pipes[pipe] = i
+            self._selector.register(pipe, selectors.EVENT_READ)
+        self._ids = dict(self.pipes)
+        self._workers = dict(zip(self.pipes, workers))
+        self._checked = time.time()  # when lost() last checked the workers
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def active(self):
+        return bool(self.pipes) and any(worker.is_alive() for worker in self.workers)
+
+    def wait(self):
+        """Wait for messages, returning the connections that have any
+        (possibly none, after HEALTH_INTERVAL)."""
+        return [key.fileobj for key, _ in self._selector.select(HEALTH_INTERVAL)]
+
+    def lost(self):
+        """Return the connections of children that have died (e.g., a
+        thread that raised an exception) without closing them, once
+        everything they sent has been received."""
+        now = time.time()
+        if now - self._checked < HEALTH_INTERVAL:
+            return []
+        self._checked = now
+        return [pipe for pipe in self.pipes if not self._workers[pipe].is_alive() and not pipe.poll()]
+
+    def remove(self, pipe):
+        if pipe in self.pipes:
+            del self.pipes[pipe]
+            self._selector.unregister(pipe)
+            pipe.stop()
+
+    def child_id(self, pipe):
+        """The index (from 0) of the child connected by a given pipe."""
+        return self._ids[pipe]
+
+    def close(self):
+        for pipe in list(self.pipes):
+            self.remove(pipe)
+
+    def terminate(self):
+        for worker in self.workers:
+            worker.terminate()
+
+
+class TCPHub(object):
+    """Children connected to the master over TCP (see TCPClient), from this
+    host or any other.
+
+    Each child is handed one of the jobs when it first connects.  The
+    authentication handshake with a connecting child runs in a thread of
+    its own (with a timeout), so a slow or stalled client never holds up
+    the master.  If its connection drops, the child reconnects as the same
+    job and resends every message the hub had not yet received from it.
+    (Messages the master sent to it in the meantime are lost, but those
+    only carry other children's results, and any result found again is
+    filtered out by the master as a duplicate.)
+
+    A child that stays disconnected for longer than `reconnect_timeout`
+    seconds is given up on (see lost()).
+
+    Args:
+        address: (host, port) to listen on (port 0 picks any free port).
+        authkey: Key (bytes) that children must also have to connect (see
+                 multiprocessing.connection).
+        jobs: A list of picklable jobs, one per child.
+        reconnect_timeout: Seconds to wait for a dropped child to reconnect.
+    """
+    def __init__(self, address, authkey, jobs, reconnect_timeout=60.0):
+        self._authkey = authkey
+        self._jobs = jobs
+        self._reconnect_timeout = reconnect_timeout
+        self._sock = socket.create_server(address)
+        self.address = self._sock.getsockname()[:2]
+        self.pipes = {}    # connection -> job ID, for each child connected
+        self.workers = []  # children started by this process, if any
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._sock, selectors.EVENT_READ)
+        # connections that have completed the handshake, each with the job ID
+        # it asked for, and a pipe to wake wait() when one is added
+        self._handshaken = queue.Queue()
+        self._wake_r, self._wake_w = os.pipe()
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._next_job = 0
+        self._conns = [None] * len(jobs)    # current connection for each job
+        self._received = [0] * len(jobs)    # messages received for each job
+        self._finished = [False] * len(jobs)
+        self._dropped = {}                  # job ID -> time its connection dropped
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def active(self):
+        if all(self._finished):
+            return False
+        # a local child that has exited will never connect (or reconnect)
+        return not self.workers or any(worker.is_alive() for worker in self.workers)
+
+    def wait(self):
+        """Wait for messages or new connections, returning the connections
+        that have messages (possibly none, after HEALTH_INTERVAL)."""
+        ready = []
+        for key, _ in self._selector.select(HEALTH_INTERVAL):
+            if key.fileobj is self._sock:
+                self._accept()
+            elif key.fileobj is self._wake_r:
+                os.read(self._wake_r, 4096)
+                while not self._handshaken.empty():
+                    self._add(*self._handshaken.get())
+            else:
+                ready.append(key.fileobj)
+        return ready
+
+    def lost(self):
+        """Give up on any child that has not reconnected in time, returning
+        its last connection."""
+        lost = []
+        now = time.time()
+        for job_id, dropped in list(self._dropped.items()):
+            if now - dropped > self._reconnect_timeout:
+                del self._dropped[job_id]
+                self._finished[job_id] = True  # (so active() can end)
+                lost.append(self._conns[job_id])
+        return lost
+
+    def remove(self, pipe):
+        if pipe in self.pipes:
+            del self.pipes[pipe]
+            self._selector.unregister(pipe)
+            pipe.stop()
+            if not self._finished[pipe.job_id]:
+                self._dropped[pipe.job_id] = time.time()
+
+    def child_id(self, pipe):
+        """The index (from 0) of the job of the child connected by a given
+        pipe (the same across reconnects)."""
+        return pipe.job_id
+
+    def close(self):
+        self._stop_listening()
+        for pipe in list(self.pipes):
+            self.remove(pipe)
+
+    def terminate(self):
+        self._stop_listening()
+        for pipe in self.pipes:
+            pipe.send('terminate')
+        for worker in self.workers:
+            worker.terminate()
+
+    def _stop_listening(self):
+        # accept no more children
+        if self._sock.fileno() >= 0:
+            self._selector.unregister(self._sock)
+            self._sock.close()
+            # (the wake pipe stays open for any handshake still running)
+            self._selector.unregister(self._wake_r)
+            while not self._handshaken.empty():
+                self._handshaken.get()[0].close()
+
+    def _accept(self):
+        sock, _ = self._sock.accept()
+        threading.Thread(target=self._handshake, args=(sock,), daemon=True).start()
+
+    def _handshake(self, sock):
+        # (in a thread of its own)
+        conn = connection.Connection(sock.detach())
+        _set_timeout(conn, HANDSHAKE_TIMEOUT)  # (until the job is sent: see _add())
+        try:
+            # the same handshake as multiprocessing.connection.Listener.accept()
+            connection.deliver_challenge(conn, self._authkey)
+            connection.answer_challenge(conn, self._authkey)
+            hello, job_id = conn.recv()
+            assert hello == 'hello'
+        except (OSError, EOFError, AssertionError, TypeError, ValueError, connection.AuthenticationError):
+            conn.close()
+            return
+
+        if self._sock.fileno() < 0:
+            conn.close()  # the hub has stopped listening
+            return
+        # hand it to the master's thread (see wait())
+        self._handshaken.put((conn, job_id))
+        os.write(self._wake_w, b"\0")
+
+    def _add(self, conn, job_id):
+        # a connection that has completed the handshake, asking for a job
+        job = None
+        if job_id is None:
+            # a new child: give it the next job, if there is one left
+            if self._next_job < len(self._jobs):
+                job_id = self._next_job
+                job = self._jobs[job_id]
+                self._next_job += 1
+        elif not 0 <= job_id < self._next_job:
+            conn.close()
+            return
+        elif self._conns[job_id] is not None:
+            # a child reconnecting; drop its old connection
+            self.remove(self._conns[job_id])
+            self._conns[job_id].close()
+            self._dropped.pop(job_id, None)
+
+        try:
+            if job_id is None:
+                conn.send(('job', None, 0, None))  # nothing left to do
+                conn.close()
+                return
+            conn.send(('job', job_id, self._received[job_id], job))
+            if self._finished[job_id]:
+                conn.send('terminate')
+            _set_timeout(conn, 0)
+        except OSError:
+            conn.close()
+            return
+
+        hubconn = QueuedConnection(HubConnection(conn, self, job_id))
+        self._conns[job_id] = hubconn
+        self.pipes[hubconn] = job_id
+        self._selector.register(hubconn, selectors.EVENT_READ)
+
+
+class HubConnection(object):
+    """The master's end of a child's connection to a TCPHub.  It counts the
+    messages received (for resending after a reconnect), and a dropped
+    connection just reads as EOF (or ignores sends) until the child
+    reconnects."""
+    def __init__(self, conn, hub, job_id):
+        self._conn = conn
+        self._hub = hub
+        self.job_id = job_id
+        self._lock = threading.Lock()  # held while sending (acks are sent by recv())
+
+    def send(self, msg):
+        with self._lock:
+            try:
+                self._conn.send(msg)
+            except OSError:
+                pass  # dropped
+
+    def recv(self):
+        try:
+            msg = self._conn.recv()
+        except OSError:
+            raise EOFError
+        self._hub._received[self.job_id] += 1
+        received = self._hub._received[self.job_id]
+        if received % ACK_INTERVAL == 0:
+            # the child need not keep these for resending any more
+            self.send(('ack', received))
+        if msg[0] in ('done', 'complete'):
+            self._hub._finished[self.job_id] = True
+        return msg
+
+    def poll(self, timeout=0.0):
+        try:
+            return self._conn.poll(timeout)
+        except OSError:
+            return True  # let recv() report it
+
+    def fileno(self):
+        return self._conn.fileno()
+
+    def close(self):
+        self._conn.close()
+
+
+class TCPClient(object):
+    """A child's connection to a TCPHub, with the same interface as a pipe.
+
+    Connecting fetches the child's job (self.job, or None if the hub has
+    none left).  If the connection drops, it reconnects (retrying for up to
+    `retry` seconds) and resends any messages the hub did not receive.
+    Messages are kept for resending only until the hub acknowledges them
+    (every ACK_INTERVAL messages, or with its count on reconnecting).
+    """
+    def __init__(self, address, authkey, retry=30.0):
+        self._address = address
+        self._authkey = authkey
+        self._retry = retry
+        self._sent = []   # every message sent but not acknowledged (to resend after a reconnect)
+        self._acked = 0   # messages acknowledged (and no longer kept)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.job_id = None
+        self.job = self._connect()
+
+    def _connect(self):
+        deadline = time.time() + self._retry
+        while True:
+            try:
+                conn = connection.Client(self._address, authkey=self._authkey)
+                conn.send(('hello', self.job_id))
+                _, job_id, received, job = conn.recv()
+                self._ack(received)
+                for msg in self._sent:
+                    conn.send(msg)
+                break
+            except (OSError, EOFError):
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.5)
+        self.job_id = job_id
+        self._conn = conn
+        return job
+
+    def _ack(self, received):
+        # called with self._lock held (or while connecting); drop the messages the hub has received
+        if received > self._acked:
+            del self._sent[:received - self._acked]
+            self._acked = received
+
+    def _reconnect(self, broken):
+        # called with self._lock held; another thread may have reconnected already
+        if self._conn is broken:
+            broken.close()
+            self._connect()
+
+    def send(self, msg):
+        with self._lock:
+            self._sent.append(msg)
+            conn = self._conn
+            try:
+                conn.send(msg)
+            except OSError:
+                self._reconnect(conn)  # resends msg, too
+
+    def recv(self):
+        while True:
+            conn = self._conn
+            try:
+                msg = conn.recv()
+            except (OSError, EOFError):
+                with self._lock:
+                    self._reconnect(conn)
+                continue
+            if msg[0] == 'ack':
+                with self._lock:
+                    self._ack(msg[1])
+                continue
+            return msg
+
+    def poll(self, timeout=0.0):
+        try:
+            return self._conn.poll(timeout)
+        except OSError:
+            return True  # let recv() reconnect
+
+    def fileno(self):
+        return self._conn.fileno()
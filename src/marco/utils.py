@@ -1,9 +1,10 @@
 """Utility class(es) for marco_py"""
-from collections import Counter, defaultdict
+from collections import Counter, defaultdict, deque
 import os
+import select
+import struct
 import subprocess
 import threading
-import types
 
 # Three options for measuring time: choose one.
 # TODO: Consider using time.process_time() (only in 3.3, though)
@@ -18,41 +19,6 @@ _get_time = time.time   # wall-time
 #_get_time = lambda: sum(os.times()[:4])  # combined user/sys time for this process and its children
 
 
-def synchronize_class(sync_class):
-    """Make any class [somewhat] thread-safe by acquiring an
-    object-wide lock on every method call.  Note: this will
-    *not* protect access to non-method attributes.
-
-    Based on: http://theorangeduck.com/page/synchronized-python
-    """
-    lock = threading.RLock()
-
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            with lock:
-                return func(*args, **kwargs)
-        return wrapper
-
-    orig_init = sync_class.__init__
-
-    def __init__(self, *args, **kwargs):
-        self.__lock__ = lock          # not used by this code, but could be useful
-        self.__synchronized__ = True  # a flag to check in assertions
-        orig_init(self, *args, **kwargs)
-
-    sync_class.__init__ = __init__
-
-    for key in dir(sync_class):
-        val = getattr(sync_class, key)
-        # synchronize all methods except __init__ and __new__ (no other thread
-        # can have a reference to an object before __init__ complete,
-        # as far as I know)
-        if isinstance(val, (types.MethodType, types.FunctionType)) and key != '__init__' and key != '__new__':
-            setattr(sync_class, key, decorator(val))
-
-    return sync_class
-
-
 class ExecutableException(Exception):
     pass
 
@@ -74,6 +40,255 @@ def check_executable(name, exepath):
         raise ExecutableException("{0} binary {1} is not executable.\nIt may be compiled for a different platform.".format(name, exepath))
 
 
+class ThreadConnection(object):
+    """One end of a two-way channel between threads of one process, with the
+    parts of the multiprocessing Connection interface used for pipes here
+    (send, recv, poll, and fileno, so it can be used with select()).
+    Messages are passed by reference, not pickled.  Create ends in
+    connected pairs with thread_pipe().
+    """
+    def __init__(self, inbox, outbox):
+        # each box is a (deque of messages, read fd, write fd) triple; one
+        # byte is written to the box's os.pipe() per message, so its read
+        # end is readable exactly while messages are waiting
+        self._inbox = inbox
+        self._outbox = outbox
+
+    def send(self, msg):
+        messages, _, wfd = self._outbox
+        messages.append(msg)
+        os.write(wfd, b"\0")
+
+    def recv(self):
+        messages, rfd, _ = self._inbox
+        os.read(rfd, 1)
+        return messages.popleft()
+
+    def poll(self, timeout=0.0):
+        ready, _, _ = select.select([self._inbox[1]], [], [], timeout)
+        return bool(ready)
+
+    def fileno(self):
+        return self._inbox[1]
+
+
+def thread_pipe():
+    """Return a connected pair of ThreadConnections, like multiprocessing.Pipe()."""
+    a = (deque(),) + os.pipe()
+    b = (deque(),) + os.pipe()
+    return ThreadConnection(a, b), ThreadConnection(b, a)
+
+
+class ResultBatcher(object):
+    """Wrap a pipe to send results (('U', ...) and ('S', ...) messages) in
+    batches of up to `size` results, framed as a single ('B', results, t)
+    message, where t is the time the oldest result in the batch was queued.
+    A partial batch is sent once its oldest result has waited `window`
+    seconds.  Any other message flushes the current batch and is then sent
+    immediately, so the order of all messages is preserved.  Receiving is
+    passed through to the pipe unchanged.
+    """
+    def __init__(self, pipe, size, window):
+        self._pipe = pipe
+        self._size = size
+        self._window = window
+        self._batch = []
+        self._started = None
+        self._cond = threading.Condition()
+
+        flusher = threading.Thread(target=self._flush_thread)
+        flusher.daemon = True
+        flusher.start()
+
+    def send(self, msg):
+        with self._cond:
+            if msg[0] in ('U', 'S'):
+                if not self._batch:
+                    self._started = _get_time()
+                    self._cond.notify()  # start the flusher's clock
+                self._batch.append(msg)
+                if len(self._batch) >= self._size:
+                    self._flush()
+            else:
+                self._flush()
+                self._pipe.send(msg)
+
+    def poll(self, *args):
+        return self._pipe.poll(*args)
+
+    def recv(self):
+        return self._pipe.recv()
+
+    def _flush(self):
+        # must hold self._cond
+        if self._batch:
+            self._pipe.send(('B', self._batch, self._started))
+            self._batch = []
+
+    def _flush_thread(self):
+        with self._cond:
+            while True:
+                if not self._batch:
+                    self._cond.wait()
+                    continue
+                remaining = self._started + self._window - _get_time()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                else:
+                    self._flush()
+
+
+def unbatch(msg):
+    """Return the list of results in a message (a batch or a single result)."""
+    if msg[0] == 'B':
+        return msg[1]
+    else:
+        return [msg]
+
+
+class ResultLog(object):
+    """A log of results in a shared file (placed in shared memory, where
+    available), used to distribute results to all children without sending
+    each one through every child's pipe.
+
+    The master is the only writer.  The log is a ring of `capacity` bytes:
+    each record (source, type, length, encoded result) is written at a
+    logical offset that only grows, and the space of the oldest records is
+    reclaimed once every reader has read past them.  If a reader falls so
+    far behind that there is no room, the oldest records are reclaimed
+    anyway: like transport.QueuedConnection, the log drops results rather
+    than make the master wait, as a result a child misses is only found
+    again and filtered out by the master as a duplicate.
+
+    The header holds the capacity, the number of readers, the committed
+    start and end of the records, and each reader's position.  Records are
+    written before the end is advanced past them, and the start is advanced
+    before the space it frees is overwritten, so readers never see a
+    partial record and no locking is needed.  A reader skips records that
+    originated from its own source id (which is also its reader index).
+    Results are stored as encoded by resultcodec.
+    """
+    _header = struct.Struct("=4q")     # capacity, readers, start, end
+    _position = struct.Struct("=q")    # a reader's position (after the header)
+    _record = struct.Struct("=iii")    # source id, type (0: 'U', 1: 'S'), length of the encoded result
+    _types = ('U', 'S')
+
+    # default size of the ring, in bytes
+    capacity = 16 * 1024 * 1024
+
+    def __init__(self, path, source=None):
+        self._fd = os.open(path, os.O_RDWR)
+        self._source = source
+        self._capacity, self._readers, self._start, self._end = self._header.unpack(os.pread(self._fd, self._header.size, 0))
+        self._data = self._header.size + self._readers * self._position.size  # file offset of the ring
+        self._pos = 0            # (reader) end of the last record read
+        self._records = deque()  # (writer) end of each record in the ring, oldest first
+        self.dropped = 0         # (writer) results reclaimed before every reader read them
+
+    @classmethod
+    def create(cls, fd, readers, capacity=None):
+        """Initialize an empty log for the given number of readers in the
+        (empty) file open as fd."""
+        capacity = capacity or cls.capacity
+        os.write(fd, cls._header.pack(capacity, readers, 0, 0))
+        os.ftruncate(fd, cls._header.size + readers * cls._position.size + capacity)
+
+    def _write(self, pos, data):
+        offset = pos % self._capacity
+        split = self._capacity - offset
+        os.pwrite(self._fd, data[:split], self._data + offset)
+        if len(data) > split:
+            os.pwrite(self._fd, data[split:], self._data)
+
+    def _read(self, pos, size):
+        offset = pos % self._capacity
+        data = os.pread(self._fd, min(size, self._capacity - offset), self._data + offset)
+        if len(data) < size:
+            data += os.pread(self._fd, size - len(data), self._data)
+        return data
+
+    def _positions(self):
+        data = os.pread(self._fd, self._readers * self._position.size, self._header.size)
+        return [pos for pos, in self._position.iter_unpack(data)]
+
+    def _commit(self, start, end):
+        os.pwrite(self._fd, self._header.pack(self._capacity, self._readers, start, end), 0)
+
+    def append(self, results, source):
+        """Append results found by the given source.
+
+        Returns:
+            The ids of the readers that had read everything before these
+            results (or some of them), and so may be waiting to be woken
+            (see incoming()).
+        """
+        before = self._end
+        read_by_all = min(self._positions(), default=self._end)
+        for result in results:
+            data = self._record.pack(source, self._types.index(result[0]), len(result[1])) + result[1]
+            if len(data) > self._capacity:
+                self.dropped += 1
+                continue
+            if self._end + len(data) - self._start > self._capacity:
+                # reclaim the oldest records, committing the new start before overwriting them
+                while self._end + len(data) - self._start > self._capacity:
+                    self._start = self._records.popleft()
+                    if self._start > read_by_all:
+                        self.dropped += 1
+                self._commit(self._start, self._end)
+            self._write(self._end, data)
+            self._end += len(data)
+            self._records.append(self._end)
+        self._commit(self._start, self._end)
+        return [i for i, pos in enumerate(self._positions()) if before <= pos < self._end]
+
+    def read(self):
+        """Return a list of all results committed since the last read (except
+        this reader's own)."""
+        results = []
+        while True:
+            _, _, start, end = self._header.unpack(os.pread(self._fd, self._header.size, 0))
+            if end <= self._pos:
+                # (checked after this reader's position was last stored, so
+                # the writer sees that position in append() and wakes it)
+                return results
+            if start > self._pos:
+                # overrun: skip to the oldest record still in the ring
+                self._pos = start
+            data = self._read(self._pos, end - self._pos)
+            start = self._header.unpack(os.pread(self._fd, self._header.size, 0))[2]
+            if start > self._pos:
+                # overrun while reading: the data may have been overwritten
+                continue
+
+            offset = 0
+            while offset < len(data):
+                source, restype, length = self._record.unpack_from(data, offset)
+                offset += self._record.size
+                if source != self._source:
+                    results.append((self._types[restype], data[offset:offset + length]))
+                offset += length
+            self._pos = end
+            os.pwrite(self._fd, self._position.pack(self._pos), self._header.size + self._source * self._position.size)
+
+
+def incoming(pipe, log=None):
+    """Yield each message received on a pipe and, if a ResultLog is given,
+    each group of new results read from the log (as a ('B', results, None)
+    batch message).  The log is read before waiting on the pipe, and the
+    master sends a 'log' message (not yielded) to wake a reader that has
+    read everything when it adds more (see ResultLog.append()).
+    """
+    while True:
+        if log is not None:
+            results = log.read()
+            if results:
+                yield ('B', results, None)
+        msg = pipe.recv()
+        if msg != 'log':
+            yield msg
+
+
 class Statistics(object):
     """
     >>> import time   # for time.sleep() in below examples
@@ -167,6 +382,13 @@ class Statistics(object):
 
         return self._times
 
+    def get_time(self, category):
+        # the time accumulated so far, excluding any still-running timer
+        # (unlike get_times(), safe while other threads are timing blocks)
+        if category == 'total':
+            return self.total_time()
+        return self._times[category]
+
     def get_counts(self):
         return self._counts
 
@@ -1,4 +1,5 @@
 #include "minisat/core/Solver.h"
+#include "rotation.h"
 
 using namespace Minisat;
 
@@ -42,6 +43,13 @@ extern "C" {
         return ret;
     }
 
+    // Change the polarity (as in newVar()) of variables start..end-1
+    void setPolarities(Solver* s, int start, int end, uint8_t polarity) {
+        for (int i = start ; i < end ; i++) {
+            s->setPolarity(i, lbool(polarity));
+        }
+    }
+
     bool addClause(Solver* s, int len, int* lits) {
         vec<Lit> clause;
         for (int i = 0 ; i < len ; i++) {
@@ -53,6 +61,43 @@ extern "C" {
         return s->addClause(itoLit(lit));
     }
 
+    // Add many clauses at once from a flat array of literals in which each
+    // clause is terminated by a 0.  groups gives each clause's group:
+    // 0 adds it as a hard clause, and g > 0 adds it with the relaxation
+    // variable for (0-based) soft constraint g-1 (nv is the number of
+    // original variables).
+    // Returns 1 on success, 0 if a conflict was found when adding a clause,
+    // or -1 if the input refers to variables not yet created or is truncated.
+    int addClausesBulk(Solver* s, int nv, int len, const int* lits, int nclauses, const int* groups) {
+        int n = s->nVars();
+        bool ok = true;
+        int pos = 0;
+        vec<Lit> clause;
+        for (int c = 0 ; c < nclauses ; c++) {
+            clause.clear();
+            if (groups[c] > 0) {
+                if (nv + groups[c] > n) return -1;
+                clause.push( ~mkLit(nv + groups[c] - 1) );
+            }
+            while (pos < len && lits[pos] != 0) {
+                if (lits[pos] > n || -lits[pos] > n) return -1;
+                clause.push( itoLit(lits[pos++]) );
+            }
+            if (pos == len) return -1;
+            pos++;  // skip the terminating 0
+            ok = s->addClause(clause) && ok;
+        }
+        return ok;
+    }
+
+    // Keep an index of clauses, given as for addClausesBulk(), for model
+    // rotation in shrinkSubset().  Returns NULL if the input refers to
+    // variables beyond nv or is truncated.
+    Rotator* Rotator_new(int nv, int len, const int* lits, int nclauses, const int* groups) {
+        return buildRotator(nv, len, lits, nclauses, groups);
+    }
+    void Rotator_delete(Rotator* r) { delete r; }
+
     bool solve(Solver* s) { return s->solve(); }
     bool solve_assumptions(Solver* s, int len, int* lits) {
         vec<Lit> assumptions;
@@ -145,6 +190,160 @@ extern "C" {
         return len;
     }
 
+    // Deletion-based shrinking of an UNSAT subset of the soft constraints down
+    // to a minimal UNSAT subset (MUS), all without returning to the caller.
+    // Uses clause-set refinement: whenever a check is UNSAT, the current set
+    // is reduced to the core of that check.
+    // (subset and hard contain 0-based constraint indexes; constraints in hard
+    //  are known to be necessary and are never tested for removal)
+    // If rot is not NULL, it must index all of the solver's clauses, and each
+    // constraint found necessary is followed by recursive model rotation,
+    // which finds more necessary constraints without further solver calls.
+    // Fills mus with the result (sorted, with offset added to each index)
+    // and returns its size.
+    int shrinkSubset(Solver* s, int nv, int len, const int* subset, int hardlen, const int* hard, int* mus, int offset, Rotator* rot) {
+        const char IN = 1;
+        const char HARD = 2;
+        const char CORE = 4;
+        int n = s->nVars() - nv;
+        char * status = new char[n]();
+        for (int i = 0 ; i < len ; i++) {
+            status[subset[i]] = IN;
+        }
+        for (int i = 0 ; i < hardlen ; i++) {
+            status[hard[i]] |= HARD;
+        }
+
+        // The assumptions are the constraints currently IN, kept up to date
+        // in place: pos[c] is the position of c's literal (or -1), so that c
+        // can be removed by moving the last literal into its place.
+        int * pos = new int[n];
+        for (int i = 0 ; i < n ; i++) {
+            pos[i] = -1;
+        }
+        char * model = (rot != NULL) ? new char[nv] : NULL;
+        vec<Lit> assumptions;
+        for (int i = 0 ; i < len ; i++) {
+            int c = subset[i];
+            if (pos[c] < 0) {
+                pos[c] = assumptions.size();
+                assumptions.push( mkLit(nv + c) );
+            }
+        }
+
+        for (int i = 0 ; i < len ; i++) {
+            int c = subset[i];
+            if (!(status[c] & IN) || (status[c] & HARD)) {
+                // may have been removed by refinement already
+                continue;
+            }
+            status[c] &= ~IN;
+            Lit last = assumptions.last();
+            assumptions[pos[c]] = last;
+            pos[var(last) - nv] = pos[c];
+            assumptions.pop();
+            pos[c] = -1;
+
+            if (s->solve(assumptions)) {
+                // c is necessary
+                status[c] |= IN;
+                pos[c] = assumptions.size();
+                assumptions.push( mkLit(nv + c) );
+                if (rot != NULL) {
+                    for (int v = 0 ; v < nv ; v++) {
+                        model[v] = (s->modelValue(v) == l_True);
+                    }
+                    rotateModel(rot, model, status, IN, HARD, c);
+                }
+            }
+            else if (s->conflict.size() < assumptions.size()) {
+                // remove anything not in the core
+                for (int j = 0 ; j < s->conflict.size() ; j++) {
+                    status[var(s->conflict[j]) - nv] |= CORE;
+                }
+                int kept = 0;
+                for (int j = 0 ; j < assumptions.size() ; j++) {
+                    int d = var(assumptions[j]) - nv;
+                    if (status[d] & CORE) {
+                        status[d] &= ~CORE;
+                        pos[d] = kept;
+                        assumptions[kept++] = assumptions[j];
+                    }
+                    else {
+                        status[d] &= ~IN;
+                        pos[d] = -1;
+                    }
+                }
+                assumptions.shrink(assumptions.size() - kept);
+            }
+        }
+
+        int count = 0;
+        for (int i = 0 ; i < n ; i++) {
+            if (status[i] & IN) mus[count++] = i + offset;
+        }
+        delete[] model;
+        delete[] pos;
+        delete[] status;
+        return count;
+    }
+
+    // Grow a SAT subset of the soft constraints to a maximal SAT subset (MSS),
+    // all without returning to the caller.  Constraints outside the initial
+    // subset are tested in index order, and after every SAT check the current
+    // set absorbs all soft constraints satisfied by the model found.
+    // (subset and skip contain 0-based constraint indexes; constraints in skip
+    //  are known not to extend the subset and are never tested)
+    // nc is the number of soft constraints.
+    // Fills mss with the result (sorted, with offset added to each index)
+    // and returns its size.
+    int growSubset(Solver* s, int nv, int nc, int len, const int* subset, int skiplen, const int* skip, int* mss, int offset) {
+        const char IN = 1;
+        const char SKIP = 2;
+        char * status = new char[nc]();
+        for (int i = 0 ; i < len ; i++) {
+            status[subset[i]] = IN;
+        }
+        for (int i = 0 ; i < skiplen ; i++) {
+            status[skip[i]] |= SKIP;
+        }
+
+        // the assumptions are the constraints currently IN (only ever added to)
+        vec<Lit> assumptions;
+        for (int j = 0 ; j < nc ; j++) {
+            if (status[j] & IN) {
+                assumptions.push( mkLit(nv + j) );
+            }
+        }
+        for (int c = 0 ; c < nc ; c++) {
+            if (status[c]) {
+                // already included (possibly from a model), or skipped
+                continue;
+            }
+            assumptions.push( mkLit(nv + c) );
+            if (s->solve(assumptions)) {
+                // add c and any other satisfied constraints
+                status[c] |= IN;
+                for (int j = 0 ; j < nc ; j++) {
+                    if (!(status[j] & IN) && s->modelValue(nv + j) == l_True) {
+                        status[j] |= IN;
+                        assumptions.push( mkLit(nv + j) );
+                    }
+                }
+            }
+            else {
+                assumptions.pop();
+            }
+        }
+
+        int count = 0;
+        for (int i = 0 ; i < nc ; i++) {
+            if (status[i] & IN) mss[count++] = i + offset;
+        }
+        delete[] status;
+        return count;
+    }
+
     // getter methods for accessing solver statistics
     uint64_t get_solves(Solver* s) { return s->solves; }
     uint64_t get_starts(Solver* s) { return s->starts; }
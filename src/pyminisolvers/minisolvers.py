@@ -26,7 +26,7 @@ import ctypes
 from abc import ABCMeta, abstractmethod
 from collections.abc import Iterable, Sequence
 from ctypes import c_void_p, c_ubyte, c_bool, c_int, c_int64, c_double
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Optional, Union
 
 if TYPE_CHECKING:
     IntPointer = ctypes._Pointer[ctypes.c_int]
@@ -80,11 +80,17 @@ class Solver(object):
 
         l.newVar.argtypes = [c_void_p, c_ubyte, c_bool]
         l.newVars.argtypes = [c_void_p, c_int, c_ubyte, c_bool]
+        l.setPolarities.argtypes = [c_void_p, c_int, c_int, c_ubyte]
 
         l.addClause.restype = c_bool
         l.addClause.argtypes = [c_void_p, c_int, c_void_p]
         l.addUnit.restype = c_bool
         l.addUnit.argtypes = [c_void_p, c_int]
+        l.addClausesBulk.restype = c_int
+        l.addClausesBulk.argtypes = [c_void_p, c_int, c_int, c_void_p, c_int, c_void_p]
+        l.Rotator_new.restype = c_void_p
+        l.Rotator_new.argtypes = [c_int, c_int, c_void_p, c_int, c_void_p]
+        l.Rotator_delete.argtypes = [c_void_p]
 
         l.solve.restype = c_bool
         l.solve.argtypes = [c_void_p]
@@ -99,6 +105,10 @@ class Solver(object):
         l.conflictSize.restype = c_int
         l.unsatCore.argtypes = [c_void_p, c_int, c_void_p, c_int]
         l.unsatCore.restype = c_int
+        l.shrinkSubset.argtypes = [c_void_p, c_int, c_int, c_void_p, c_int, c_void_p, c_void_p, c_int, c_void_p]
+        l.shrinkSubset.restype = c_int
+        l.growSubset.argtypes = [c_void_p, c_int, c_int, c_int, c_void_p, c_int, c_void_p, c_void_p, c_int]
+        l.growSubset.restype = c_int
         l.modelValue.argtypes = [c_void_p, c_int]
         l.modelValue.restype = c_int
         l.fillModel.argtypes = [c_void_p, c_void_p, c_int, c_int]
@@ -128,16 +138,23 @@ class Solver(object):
         self.lib.Solver_delete(self.s)
 
     @staticmethod
-    def _to_intptr(a: array.array) -> tuple[IntPointer, int]:
+    def _to_intptr(a: Union[array.array, memoryview]) -> tuple[IntPointer, int]:
         """Helper function to get a ctypes POINTER(c_int) for an array"""
+        if isinstance(a, memoryview):
+            # point into the buffer itself (e.g., an mmap'd file) rather than copying it
+            buf = (c_int * len(a)).from_buffer(a)
+            return ctypes.cast(buf, IntPointer), len(a)
         addr, size = a.buffer_info()
         return ctypes.cast(addr, IntPointer), size
 
     @staticmethod
-    def _get_array(seq: Iterable[int]) -> array.array:
-        """Helper function to turn any iterable into an array (unless it already is one)"""
+    def _get_array(seq: Iterable[int]) -> Union[array.array, memoryview]:
+        """Helper function to turn any iterable into an array (unless it already
+        is one, or is a writable memoryview of C ints)"""
         if isinstance(seq, array.array):
             return seq
+        elif isinstance(seq, memoryview) and seq.format == 'i' and not seq.readonly:
+            return seq
         else:
             return array.array('i', seq)
 
@@ -189,6 +206,24 @@ class Solver(object):
         pol_int = self.polarity_map[polarity]
         return self.lib.newVars(self.s, n, pol_int, dvar)
 
+    def set_polarities(self, polarity: Optional[bool], start: int = 0, end: Optional[int] = None) -> None:
+        """Change the default polarity of existing variables.
+
+        Args:
+            polarity (bool):
+              The new default polarity, as in new_var().
+            start (int):
+              The first variable to change (0-based counting).
+            end (int):
+              One past the last variable to change (default: all variables
+              from start).
+        """
+        if end is None:
+            end = self.nvars()
+        if not 0 <= start <= end <= self.nvars():
+            raise Exception("Variables %d..%d are not all created yet.  Call new_var() or new_vars() first." % (start, end-1))
+        self.lib.setPolarities(self.s, start, end, self.polarity_map[polarity])
+
 
     def nvars(self) -> int:
         '''Get the number of variables created in the solver.'''
@@ -382,6 +417,13 @@ class SubsetMixin(Solver):
     """A mixin for any Solver class that lets it reason about subsets of a clause set."""
     _origvars: Optional[int] = None
     _relvars: Optional[int] = None
+    _rotator: Optional[int] = None
+
+    def __del__(self) -> None:
+        """Delete the rotation index, if any, and the Solver object"""
+        if self._rotator is not None:
+            self.lib.Rotator_delete(self._rotator)
+        super().__del__()
 
     def set_varcounts(self, vars: int, constraints: int) -> None:
         """Record how many of the solver's variables and clauses are
@@ -390,6 +432,13 @@ class SubsetMixin(Solver):
         self._origvars = vars
         self._relvars = constraints
 
+    def _check_indexes(self, indexes: Union[array.array, memoryview], name: str) -> None:
+        """Raise a ValueError unless every index is that of a soft constraint
+        (the native code uses them directly as offsets into its arrays)."""
+        if len(indexes) and (min(indexes) < 0 or max(indexes) >= self._relvars):
+            bad = [i for i in indexes if not 0 <= i < self._relvars]
+            raise ValueError("%s contains indexes outside the %d soft constraints: %s" % (name, self._relvars, bad))
+
     def add_clause_instrumented(self, lits: Sequence[int], index: int) -> None:
         """Add a "soft" clause with a relaxation variable (the relaxation var.
         is based on the index, which is assumed to be 0-based).
@@ -409,6 +458,59 @@ class SubsetMixin(Solver):
         instrumented_clause.extend(lits)
         self.add_clause(instrumented_clause)
 
+    def add_clauses_bulk(self, lits: Sequence[int], groups: Sequence[int]) -> bool:
+        """Add many hard and/or soft clauses in a single call.
+
+        Args:
+            lits:
+                A flat sequence of the literals of all clauses, specified as in
+                `add_clause()`, with each clause terminated by a 0.
+            groups:
+                A sequence giving each clause's group.  A clause in group 0 is
+                added as a hard clause (as with `add_clause()`), and a clause in
+                group g > 0 is added as part of soft constraint g-1 (as with
+                `add_clause_instrumented(clause, g-1)`).
+
+        Returns:
+            False if a conflict was detected when adding any clause, True
+            otherwise.
+        """
+        if self._origvars is None:
+            raise Exception("SubsetSolver.set_varcounts() must be called before .add_clauses_bulk()")
+        a = self._get_array(lits)
+        a_ptr, size = self._to_intptr(a)
+        g = self._get_array(groups)
+        g_ptr, g_size = self._to_intptr(g)
+        ret = self.lib.addClausesBulk(self.s, self._origvars, size, a_ptr, g_size, g_ptr)
+        if ret < 0:
+            raise Exception("Clauses refer to variables not created yet or are not all terminated by 0.  Call new_var() or new_vars() first.")
+        return bool(ret)
+
+    def set_rotation_clauses(self, lits: Sequence[int], groups: Sequence[int]) -> None:
+        """Keep an index of the solver's clauses, given exactly as for
+        `add_clauses_bulk()`, in the solver library, and use it for model
+        rotation in `shrink_subset()`.  Each constraint found necessary there
+        is then followed by recursive model rotation, which can find more
+        necessary constraints without any further solver calls.
+
+        The given clauses must be all of the solver's clauses (apart from
+        those involving only variables beyond the original ones): rotation
+        flips variables in models, and any other constraints could be
+        violated.
+        """
+        if self._origvars is None:
+            raise Exception("SubsetSolver.set_varcounts() must be called before .set_rotation_clauses()")
+        a = self._get_array(lits)
+        a_ptr, size = self._to_intptr(a)
+        g = self._get_array(groups)
+        g_ptr, g_size = self._to_intptr(g)
+        rotator = self.lib.Rotator_new(self._origvars, size, a_ptr, g_size, g_ptr)
+        if not rotator:
+            raise Exception("Clauses refer to variables beyond the original variables or are not all terminated by 0.")
+        if self._rotator is not None:
+            self.lib.Rotator_delete(self._rotator)
+        self._rotator = rotator
+
     def solve_subset(self, subset: Sequence[int], extra_assumps: Optional[Sequence[int]] = None) -> bool:
         """Solve a subset of the constraints containing all "hard" clauses
         (those added with the regular `add_clause()` method) and the
@@ -452,6 +554,87 @@ class SubsetMixin(Solver):
         self.lib.unsatCore(self.s, self._origvars, a_ptr, offset)
         return a
 
+    def shrink_subset(self, subset: Sequence[int], hard: Optional[Sequence[int]] = None, offset: int = 0) -> array.array:
+        """Shrink an unsatisfiable subset of the soft constraints to a minimal
+        unsatisfiable subset (MUS).  The deletion-based search (with clause-set
+        refinement from each UNSAT core) runs entirely within the solver
+        library, with model rotation if `set_rotation_clauses()` has been
+        called.  Assumes the given subset is unsatisfiable.
+
+        Args:
+            subset:
+                A sequence of the indexes of the soft constraints to shrink.
+                Constraints are tested for removal in this order.
+            hard:
+                An optional sequence of indexes of constraints known to be in
+                every MUS of the subset.  These will not be tested.
+            offset (int):
+                Optional offset to be added to the zero-based indexes from
+                MiniSat.
+
+        Returns:
+            A sorted array of constraint indexes comprising an MUS.
+
+        Raises:
+            ValueError: If any index is not that of a soft constraint.
+        """
+        if self._origvars is None or self._relvars is None:
+            raise Exception("SubsetSolver.set_varcounts() must be called before .shrink_subset()")
+        a = self._get_array(subset)
+        self._check_indexes(a, "subset")
+        a_ptr, size = self._to_intptr(a)
+        if hard:
+            h = self._get_array(hard)
+            self._check_indexes(h, "hard")
+            h_ptr, h_size = self._to_intptr(h)
+        else:
+            h_ptr, h_size = None, 0
+        mus = array.array('i', [-1] * size)
+        mus_ptr, _ = self._to_intptr(mus)
+        count = self.lib.shrinkSubset(self.s, self._origvars, size, a_ptr, h_size, h_ptr, mus_ptr, offset, self._rotator)
+        # reduce the array down to just the valid indexes
+        return mus[:count]
+
+    def grow_subset(self, subset: Sequence[int], skip: Optional[Sequence[int]] = None, offset: int = 0) -> array.array:
+        """Grow a satisfiable subset of the soft constraints to a maximal
+        satisfiable subset (MSS).  The extension loop runs entirely within the
+        solver library, and every soft constraint satisfied by each model
+        found is added along the way.  Assumes the given subset is
+        satisfiable.
+
+        Args:
+            subset:
+                A sequence of the indexes of the soft constraints to grow.
+            skip:
+                An optional sequence of indexes of constraints known not to be
+                in any MSS containing the subset.  These will not be tested.
+            offset (int):
+                Optional offset to be added to the zero-based indexes from
+                MiniSat.
+
+        Returns:
+            A sorted array of constraint indexes comprising an MSS.
+
+        Raises:
+            ValueError: If any index is not that of a soft constraint.
+        """
+        if self._origvars is None or self._relvars is None:
+            raise Exception("SubsetSolver.set_varcounts() must be called before .grow_subset()")
+        a = self._get_array(subset)
+        self._check_indexes(a, "subset")
+        a_ptr, size = self._to_intptr(a)
+        if skip:
+            sk = self._get_array(skip)
+            self._check_indexes(sk, "skip")
+            sk_ptr, sk_size = self._to_intptr(sk)
+        else:
+            sk_ptr, sk_size = None, 0
+        mss = array.array('i', [-1] * self._relvars)
+        mss_ptr, _ = self._to_intptr(mss)
+        count = self.lib.growSubset(self.s, self._origvars, self._relvars, size, a_ptr, sk_size, sk_ptr, mss_ptr, offset)
+        # reduce the array down to just the valid indexes
+        return mss[:count]
+
     def sat_subset(self, offset: int = 0) -> array.array:
         """Get the set of clauses satisfied in the last check performed by
         `solve_subset()`.  Assumes the last such check was SAT.  This may
@@ -666,6 +849,18 @@ class MinisatSubsetSolver(SubsetMixin, MinisatSolver):
     >>> core = S.unsat_core()
     >>> sorted(core)
     [0, 1, 2, 3]
+
+    An unsatisfiable subset can be shrunk to a minimal unsatisfiable subset
+    (MUS) in a single call.
+
+    >>> list(S.shrink_subset([0,1,2,3,4]))
+    [0, 4]
+
+    Similarly, a satisfiable subset can be grown to a maximal satisfiable
+    subset (MSS).
+
+    >>> list(S.grow_subset([0]))
+    [0, 1, 2]
     """
 
     pass
@@ -0,0 +1,189 @@
+// Model rotation for MUS extraction (as in MUSer2), shared by minisat.cpp
+// and minicard.cpp.  Independent of the solver: models are given as one
+// value (0 or 1) per original variable.
+
+#ifndef PYMINISOLVERS_ROTATION_H
+#define PYMINISOLVERS_ROTATION_H
+
+#include <utility>
+#include <vector>
+
+// An index of a grouped clause set, kept alongside a solver for the lifetime
+// of the solver.  Group 0 is the hard clauses, and group g > 0 is (0-based)
+// soft constraint g-1.
+struct Rotator {
+    int nv;                     // number of original variables
+    std::vector<int> lits;      // literals of all clauses, each terminated by a 0
+    std::vector<int> start;     // position in lits of each clause
+    std::vector<int> group;     // group of each clause
+    std::vector<int> occstart;  // clauses containing each literal (CSR: see litIndex())
+    std::vector<int> occs;
+    std::vector<int> grpstart;  // clauses of each group (CSR)
+    std::vector<int> grpclauses;
+
+    // scratch for rotateModel(): the groups rotated from in the current
+    // rotation are those with visited[g] == epoch
+    std::vector<int> visited;
+    int epoch;
+
+    static int litIndex(int lit) { return lit > 0 ? 2*(lit-1) : 2*(-lit-1) + 1; }
+
+    bool isTrue(const char* model, int lit) const {
+        return lit > 0 ? model[lit-1] : !model[-lit-1];
+    }
+
+    bool isFalsified(const char* model, int cl) const {
+        for (int i = start[cl] ; lits[i] != 0 ; i++) {
+            if (isTrue(model, lits[i])) return false;
+        }
+        return true;
+    }
+
+    int ngroups() const { return grpstart.size() - 1; }
+};
+
+// Build the index from clauses as given to addClausesBulk().
+// Returns NULL if the input refers to variables beyond nv or is truncated.
+inline Rotator* buildRotator(int nv, int len, const int* lits, int nclauses, const int* groups) {
+    Rotator* r = new Rotator();
+    r->nv = nv;
+    r->lits.assign(lits, lits + len);
+    r->group.assign(groups, groups + nclauses);
+    int ngroups = 1;
+    std::vector<int> occcount(2*nv + 1, 0);
+    int pos = 0;
+    for (int c = 0 ; c < nclauses ; c++) {
+        r->start.push_back(pos);
+        while (pos < len && lits[pos] != 0) {
+            if (lits[pos] > nv || -lits[pos] > nv) { delete r; return NULL; }
+            occcount[Rotator::litIndex(lits[pos]) + 1]++;
+            pos++;
+        }
+        if (pos == len) { delete r; return NULL; }
+        pos++;  // skip the terminating 0
+        if (groups[c] + 1 > ngroups) ngroups = groups[c] + 1;
+    }
+
+    // counting sort of the clauses by literal and by group
+    for (int i = 0 ; i < 2*nv ; i++) {
+        occcount[i+1] += occcount[i];
+    }
+    r->occstart = occcount;
+    r->occs.resize(occcount[2*nv]);
+    std::vector<int> grpcount(ngroups + 1, 0);
+    for (int c = 0 ; c < nclauses ; c++) {
+        grpcount[groups[c] + 1]++;
+        for (int i = r->start[c] ; lits[i] != 0 ; i++) {
+            r->occs[occcount[Rotator::litIndex(lits[i])]++] = c;
+        }
+    }
+    for (int g = 0 ; g < ngroups ; g++) {
+        grpcount[g+1] += grpcount[g];
+    }
+    r->grpstart = grpcount;
+    r->grpclauses.resize(nclauses);
+    for (int c = 0 ; c < nclauses ; c++) {
+        r->grpclauses[grpcount[groups[c]]++] = c;
+    }
+
+    r->visited.assign(ngroups, 0);
+    r->epoch = 0;
+    return r;
+}
+
+// After flipping the variable of lit (now true) in a model that falsified
+// exactly one clause of the current set (the hard clauses plus the groups of
+// the constraints with the in flag in status), find the clauses falsified by
+// the flip.  If they all belong to one soft constraint d, the model
+// witnesses that the set without d is satisfiable, so d is necessary: mark
+// it hard.  Returns d's falsified clause, to rotate from next, if it is the
+// only one and d has not been rotated from yet, or -1 otherwise.
+inline int rotateFlip(Rotator* r, const char* model, char* status, char in, char hard, int lit) {
+    int negidx = Rotator::litIndex(-lit);
+    int found = -1;
+    int fgroup = 0;
+    bool single = true;
+    for (int k = r->occstart[negidx] ; k < r->occstart[negidx+1] ; k++) {
+        int cl = r->occs[k];
+        int g = r->group[cl];
+        if (g > 0 && !(status[g-1] & in)) continue;
+        if (!r->isFalsified(model, cl)) continue;
+        if (g == 0) return -1;  // breaks a hard clause
+        if (fgroup == 0) {
+            fgroup = g;
+            found = cl;
+        }
+        else if (g != fgroup) {
+            return -1;
+        }
+        else {
+            single = false;
+        }
+    }
+    if (fgroup == 0) return -1;
+    status[fgroup-1] |= hard;
+    if (!single || r->visited[fgroup] == r->epoch) return -1;
+    r->visited[fgroup] = r->epoch;
+    return found;
+}
+
+// Model rotation from soft constraint c, just found necessary with the
+// given model, which satisfies the hard clauses and every other constraint
+// with the in flag in status.  Marks every constraint found necessary
+// (including c) with the hard flag.  This is recursive model rotation
+// extended to also rotate through constraints already known to be
+// necessary, each at most once per call, which bounds the recursion (kept
+// on an explicit stack) by the number of constraints.
+inline void rotateModel(Rotator* r, char* model, char* status, char in, char hard, int c) {
+    status[c] |= hard;
+    int g = c + 1;
+    if (g >= r->ngroups()) return;  // no clauses in the index
+
+    // rotation needs exactly one falsified clause to flip literals of
+    int falsified = -1;
+    for (int k = r->grpstart[g] ; k < r->grpstart[g+1] ; k++) {
+        int cl = r->grpclauses[k];
+        if (r->isFalsified(model, cl)) {
+            if (falsified >= 0) return;
+            falsified = cl;
+        }
+    }
+    if (falsified < 0) return;
+
+    if (++r->epoch == 0) {
+        // wrapped around: clear the stamps
+        r->visited.assign(r->visited.size(), 0);
+        r->epoch = 1;
+    }
+    r->visited[g] = r->epoch;
+
+    // each frame: a falsified clause and the position of the literal to flip next
+    std::vector< std::pair<int,int> > stack;
+    stack.push_back(std::make_pair(falsified, r->start[falsified]));
+    while (!stack.empty()) {
+        std::pair<int,int>& top = stack.back();
+        int lit = r->lits[top.second];
+        if (lit == 0) {
+            stack.pop_back();
+            if (!stack.empty()) {
+                // undo the parent's flip that led here, and move past it
+                int plit = r->lits[stack.back().second];
+                model[(plit > 0 ? plit : -plit) - 1] ^= 1;
+                stack.back().second++;
+            }
+            continue;
+        }
+        int v = (lit > 0 ? lit : -lit) - 1;
+        model[v] ^= 1;
+        int next = rotateFlip(r, model, status, in, hard, lit);
+        if (next >= 0) {
+            stack.push_back(std::make_pair(next, r->start[next]));
+        }
+        else {
+            model[v] ^= 1;
+            top.second++;
+        }
+    }
+}
+
+#endif
@@ -1,3 +1,5 @@
+import array
+import random
 import minisolvers
 import unittest
 
@@ -24,6 +26,15 @@ class MinisatTest(unittest.TestCase):
         final_index = self.solver.new_vars(5, True)
         self.assertEqual(final_index, self.numvars+5-1)
 
+    def test_set_polarities(self):
+        self.solver.new_vars(self.numvars, True)
+        self.assertTrue(self.solver.solve())
+        self.assertEqual(list(self.solver.get_model()), [1] * self.numvars)
+        self.solver.set_polarities(False, 2)
+        self.assertTrue(self.solver.solve())
+        self.assertEqual(list(self.solver.get_model()), [1, 1] + [0] * (self.numvars-2))
+        self.assertRaises(Exception, self.solver.set_polarities, True, 0, self.numvars+1)
+
     def test_add_clause_without_vars(self):
         self.assertRaises(Exception, self.solver.add_clause, [-1, 2])
 
@@ -98,6 +109,118 @@ class MinisatSubsetTest(unittest.TestCase):
         for i in range(1, self.n):
             self.assertEqual(self.solver.solve_subset(range(self.n-i)), True)
 
+    def assertMUS(self, mus):
+        self.assertEqual(self.solver.solve_subset(mus), False)
+        for i in mus:
+            self.assertEqual(self.solver.solve_subset([x for x in mus if x != i]), True)
+
+    def test_shrink_subset(self):
+        mus = self.solver.shrink_subset(range(self.n))
+        self.assertEqual(list(mus), sorted(mus))
+        self.assertMUS(mus)
+
+    def test_shrink_subset_hard(self):
+        mus = self.solver.shrink_subset(range(self.n), hard=[7])
+        self.assertIn(7, mus)
+        self.assertMUS(mus)
+        mus_offset = self.solver.shrink_subset(range(self.n), hard=[7], offset=1)
+        self.assertEqual(list(mus_offset), [x+1 for x in mus])
+
+    def test_shrink_subset_range(self):
+        self.assertRaises(ValueError, self.solver.shrink_subset, [0, self.n])
+        self.assertRaises(ValueError, self.solver.shrink_subset, range(self.n), hard=[-1])
+
+    def assertMSS(self, mss):
+        self.assertEqual(self.solver.solve_subset(mss), True)
+        for i in set(range(self.n)).difference(mss):
+            self.assertEqual(self.solver.solve_subset(list(mss) + [i]), False)
+
+    def test_grow_subset(self):
+        for i in range(self.n):
+            mss = self.solver.grow_subset([i])
+            self.assertIn(i, mss)
+            self.assertEqual(list(mss), sorted(mss))
+            self.assertMSS(mss)
+
+    def test_grow_subset_skip(self):
+        # skipped constraints are not tested, though a model may still satisfy them
+        mss = self.solver.grow_subset([], skip=[0])
+        self.assertEqual(self.solver.solve_subset(mss), True)
+        mss_offset = self.solver.grow_subset([], skip=[0], offset=1)
+        self.assertEqual(list(mss_offset), [x+1 for x in mss])
+
+    def test_grow_subset_range(self):
+        self.assertRaises(ValueError, self.solver.grow_subset, [self.n])
+        self.assertRaises(ValueError, self.solver.grow_subset, [0], skip=[self.n + 5])
+
+
+class MinisatBulkTest(MinisatSubsetTest):
+    def setUp(self):
+        self.solver = minisolvers.MinisatSubsetSolver()
+        self.clauses = [ [1], [-2], [3, 4], [-3, 5], [-4, 6], [-5, 4], [-6] ]
+        self.group = [ [1, 2, 3], [3, 4, 5] ]
+        self.n = len(self.clauses) + 1  # +1 for the group
+        self.numvars = max([max(cl) for cl in [[abs(x) for x in cl] for cl in self.clauses + self.group]])
+        self.solver.set_varcounts(self.numvars, self.n)
+        self.solver.new_vars(self.numvars + self.n)
+        lits = []
+        groups = []
+        for cl in self.group:
+            lits.extend(cl + [0])
+            groups.append(1)
+        for i, cl in enumerate(self.clauses):
+            lits.extend(cl + [0])
+            groups.append(i+2)
+        lits.extend([1, 2, 0])   # a hard clause
+        groups.append(0)
+        self.lits, self.groups = lits, groups
+        self.assertEqual(self.solver.add_clauses_bulk(lits, groups), True)
+
+    def test_bulk_without_vars(self):
+        self.assertRaises(Exception, self.solver.add_clauses_bulk, [1, 100, 0], [0])
+        self.assertRaises(Exception, self.solver.add_clauses_bulk, [1, 2], [0])
+
+    def test_bulk_memoryview(self):
+        # clauses can be passed as views of a shared buffer without copying
+        buf = bytearray(array.array('i', [-1, 2, 0, -3, 0]).tobytes())
+        lits = memoryview(buf).cast('i')
+        groups = memoryview(bytearray(array.array('i', [0, 0]).tobytes())).cast('i')
+        self.assertEqual(self.solver.add_clauses_bulk(lits, groups), True)
+        self.assertEqual(self.solver.solve_subset([]), True)
+        # [-2] is now inconsistent with the hard clauses [1, 2] and [-1, 2]
+        self.assertEqual(self.solver.solve_subset([2]), False)
+
+
+class MinisatRotationTest(MinisatBulkTest):
+    def setUp(self):
+        MinisatBulkTest.setUp(self)
+        self.solver.set_rotation_clauses(self.lits, self.groups)
+
+    def test_rotation_without_vars(self):
+        self.assertRaises(Exception, self.solver.set_rotation_clauses, [1, 100, 0], [0])
+        self.assertRaises(Exception, self.solver.set_rotation_clauses, [1, 2], [0])
+
+    def test_rotation_random(self):
+        # random 3-CNF near the threshold, one clause per constraint
+        rand = random.Random(1)
+        for _ in range(20):
+            self.solver = minisolvers.MinisatSubsetSolver()
+            nvars, n = 20, 100
+            lits = []
+            for i in range(n):
+                for v in rand.sample(range(1, nvars+1), 3):
+                    lits.append(v if rand.random() < 0.5 else -v)
+                lits.append(0)
+            groups = list(range(1, n+1))
+            self.solver.set_varcounts(nvars, n)
+            self.solver.new_vars(nvars + n)
+            self.solver.add_clauses_bulk(lits, groups)
+            self.solver.set_rotation_clauses(lits, groups)
+            self.n = n
+            if self.solver.solve_subset(range(n)):
+                continue
+            self.assertMUS(self.solver.shrink_subset(range(n)))
+
 
 class MinicardTest(unittest.TestCase):
     def setUp(self):
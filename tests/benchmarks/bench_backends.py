@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+#
+# bench_backends.py -- Compare the process and thread parallel backends
+#
+# Runs marco.py on each instance with:
+#   processes: --backend processes (one child process per enumerator, results
+#              pickled over multiprocessing pipes)
+#   threads:   --backend threads (one thread per enumerator in a single
+#              process, sharing the parsed instance, results passed by
+#              reference)
+# reporting the wall time, the number of results, and the peak memory of the
+# whole process tree (summed PSS, so pages shared between processes are only
+# counted once; sampled every 50ms, so very short runs may be underreported).
+#
+# Usage (from the tests/ directory):
+#   python3 benchmarks/bench_backends.py [parallel modes] [instance ...]
+#     e.g.: python3 benchmarks/bench_backends.py MUS,MUS,MCS,MCSonly dlx2_aa.cnf
+#
+
+import os
+import subprocess
+import sys
+import time
+
+MARCO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'marco.py')
+
+
+def children(pid):
+    try:
+        with open('/proc/%d/task/%d/children' % (pid, pid)) as f:
+            return [int(x) for x in f.read().split()]
+    except (IOError, OSError):
+        return []
+
+
+def memory_kb(pid):
+    # PSS if the kernel provides it, otherwise RSS
+    for path, field in [('/proc/%d/smaps_rollup' % pid, 'Pss:'), ('/proc/%d/status' % pid, 'VmRSS:')]:
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(field):
+                        return int(line.split()[1])
+        except (IOError, OSError):
+            pass
+    return 0
+
+
+def tree_memory_kb(pid):
+    return memory_kb(pid) + sum(tree_memory_kb(child) for child in children(pid))
+
+
+def run(backend, parallel, instance):
+    cmd = [sys.executable, MARCO, '--parallel', parallel, '--backend', backend, instance]
+    start = time.time()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    peak = 0
+    lines = []
+    # read output without blocking, sampling memory between reads
+    os.set_blocking(proc.stdout.fileno(), False)
+    while proc.poll() is None:
+        peak = max(peak, tree_memory_kb(proc.pid))
+        data = proc.stdout.read()
+        if data:
+            lines.append(data)
+        time.sleep(0.05)
+    data = proc.stdout.read()
+    if data:
+        lines.append(data)
+    elapsed = time.time() - start
+    output = b"".join(lines).split()
+    return elapsed, output.count(b'U'), output.count(b'S'), peak
+
+
+def main():
+    parallel = sys.argv[1] if len(sys.argv) > 1 else 'MUS,MUS,MCS,MCSonly'
+    instances = sys.argv[2:] or ['dlx2_aa.cnf', 'c10.cnf']
+
+    print("--parallel %s" % parallel)
+    for instance in instances:
+        print(instance)
+        for backend in ['processes', 'threads']:
+            elapsed, muses, msses, peak = run(backend, parallel, instance)
+            print("  %-9s %8.2f s  %6d MUSes  %6d MSSes  %8.1f MB peak" % (backend, elapsed, muses, msses, peak / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+#
+# bench_gcnf_io.py -- Compare ways of handing GCNF instances to MUSer2
+#
+# Runs the same set of UNSAT seeds through:
+#   tempfile: the original path (one small write() per group prefix and per
+#             clause into a disk-backed temporary file, one new MUSer2
+#             process per shrink reading that file)
+#   pipe:     MUSerSubsetSolver.shrink() (whole instance built as one buffer
+#             from cached per-group blocks, written to a pre-spawned MUSer2
+#             process over its stdin pipe)
+#
+# Usage (from the tests/ directory):
+#   python3 benchmarks/bench_gcnf_io.py [instance] [num_seeds]
+#
+
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from src.marco import CNFsolvers, mapsolvers  # noqa: E402
+
+
+class CountingFile(object):
+    """Wrap a file object, counting write() calls and bytes written."""
+    def __init__(self, f):
+        self.f = f
+        self.writes = 0
+        self.bytes = 0
+
+    def write(self, data):
+        self.writes += 1
+        self.bytes += len(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+
+def legacy_write_CNF(csolver, cnffile, seed, hard):
+    header = "p gcnf %d %d %d\n" % (csolver.nvars, len(seed), len(seed))
+    cnffile.write(header.encode())
+    for j in csolver.groups[0]:
+        cnffile.write(b"{0} ")
+        cnffile.write(csolver.dimacs[j])
+    for i in hard:
+        for j in csolver.groups[i]:
+            cnffile.write(b"{0} ")
+            cnffile.write(csolver.dimacs[j])
+    for g, i in enumerate(seed):
+        if i in hard:
+            continue
+        for j in csolver.groups[i]:
+            cnffile.write(("{%d} " % (g+1)).encode())
+            cnffile.write(csolver.dimacs[j])
+    cnffile.flush()
+
+
+def legacy_shrink(csolver, seed):
+    with tempfile.NamedTemporaryFile('wb') as cnf:
+        counter = CountingFile(cnf)
+        legacy_write_CNF(csolver, counter, seed, [])
+        args = [csolver.muser_path, '-comp', '-grp', '-v', '-1', cnf.name]
+        proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+    matchline = re.search(csolver.core_pattern, out.decode()).group(0)
+    mus = [seed[int(x)-1] for x in matchline.split()[1:-1] if int(x) > 0]
+    return mus, counter.writes, counter.bytes
+
+
+def make_seeds(csolver, count, rng):
+    # every seed is some MUS (found from a shuffled deletion order) plus
+    # a random half of the remaining constraints, so all are UNSAT
+    seeds = [list(range(1, csolver.n+1))]
+    while len(seeds) < count:
+        order = list(range(csolver.n))
+        rng.shuffle(order)
+        mus = csolver.s.shrink_subset(order, offset=1)
+        rest = csolver.complement(mus)
+        seeds.append(sorted(list(mus) + rng.sample(sorted(rest), len(rest) // 2)))
+    return seeds
+
+
+def main():
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'dlx2_aa.cnf'
+    num_seeds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    csolver = CNFsolvers.MUSerSubsetSolver(filename)
+    csolver.set_msolver(mapsolvers.MinisatMapSolver(csolver.n))
+    seeds = make_seeds(csolver, num_seeds, random.Random(1))
+
+    print("%s: %d constraints, %d seeds" % (filename, csolver.n, len(seeds)))
+
+    start = time.time()
+    writes = nbytes = 0
+    legacy_sizes = []
+    for seed in seeds:
+        mus, w, b = legacy_shrink(csolver, seed)
+        legacy_sizes.append(len(mus))
+        writes += w
+        nbytes += b
+    legacy_time = time.time() - start
+    print("tempfile: %8.2f ms/shrink  %10.1f writes/shrink  %10.1f bytes/shrink" %
+          (1000 * legacy_time / len(seeds), float(writes) / len(seeds), float(nbytes) / len(seeds)))
+
+    build_times = []
+    for _ in range(2):  # first pass fills the group block cache
+        start = time.time()
+        nbytes = 0
+        for seed in seeds:
+            nbytes += len(csolver.gcnf_bytes(seed, []))
+        build_times.append(time.time() - start)
+    start = time.time()
+    sizes = []
+    for seed in seeds:
+        sizes.append(len(csolver.shrink(seed)))
+    pipe_time = time.time() - start
+    print("pipe:     %8.2f ms/shrink  %10.1f writes/shrink  %10.1f bytes/shrink" %
+          (1000 * pipe_time / len(seeds), 1.0, float(nbytes) / len(seeds)))
+    print("          building the buffer: %.2f ms/shrink (cold cache), %.2f ms/shrink (warm cache)" %
+          (1000 * build_times[0] / len(seeds), 1000 * build_times[1] / len(seeds)))
+
+    assert sizes == legacy_sizes
+
+
+if __name__ == '__main__':
+    main()
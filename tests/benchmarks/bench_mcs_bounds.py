@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+#
+# bench_mcs_bounds.py -- Compare ways of moving through MCS size bounds in MCS-only enumeration
+#
+# Runs the MCSEnumerator (as with --mcs-only) on an instance once per mode:
+#   incremental:  one instrumented solver for all MCS size bounds k, each
+#                 bound an AtMost constraint enabled by an assumed guard,
+#                 moving up one bound at a time (--mcs-strategy linear)
+#   binary:       as incremental, but galloping/binary searching for the
+#                 next bound with any MCS left (--mcs-strategy binary)
+#   core:         as incremental, but skipping to a lower bound given by
+#                 disjoint unsat cores (--mcs-strategy core)
+#   rebuild:      a new instrumented solver for each bound k (--mcs-rebuild),
+#                 re-adding every clause and blocking clause found so far
+# reporting, for each bound k, the number of MCSes of that size and the time
+# spent per MCS (including the time to set up the bound), and the total time
+# and number of SAT calls for each mode.
+#
+# Usage (from the tests/ directory):
+#   python3 benchmarks/bench_mcs_bounds.py [instance]
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from src.marco import marco, utils  # noqa: E402
+from src.marco.MCSEnumerator import MCSEnumerator  # noqa: E402
+
+
+MODES = [
+    ('incremental', []),
+    ('binary', ['--mcs-strategy', 'binary']),
+    ('core', ['--mcs-strategy', 'core']),
+    ('rebuild', ['--mcs-rebuild']),
+]
+
+
+def run(instance, mode_args):
+    args = marco.parse_args(['--mcs-only', instance] + mode_args)
+    stats = utils.Statistics()
+    csolver = marco.setup_csolver(args, seed=None)
+    enumerator = MCSEnumerator(csolver, stats, marco.get_config(args))
+
+    # time from the start of each bound (or the previous MCS) to each MCS
+    per_k = {}  # k -> [MCS count, time]
+    start = time.time()
+    last = start
+    for _ in enumerator.enumerate():
+        now = time.time()
+        count_time = per_k.setdefault(enumerator.k, [0, 0.0])
+        count_time[0] += 1
+        count_time[1] += now - last
+        last = now
+    return per_k, time.time() - start, stats.get_counts()['solve']
+
+
+def main():
+    instance = sys.argv[1] if len(sys.argv) > 1 else 'dlx2_aa.cnf'
+    results = {name: run(instance, mode_args) for name, mode_args in MODES}
+    names = [name for name, _ in MODES]
+
+    print(instance)
+    print("   k  MCSes  " + "  ".join("%12s" % name for name in names) + "  (ms/MCS)")
+    bounds = sorted(set().union(*(results[name][0] for name in names)))
+    for k in bounds:
+        row = []
+        for name in names:
+            count, elapsed = results[name][0].get(k, [0, 0.0])
+            row.append(1000 * elapsed / count if count else float('nan'))
+        count = max(results[name][0].get(k, [0])[0] for name in names)
+        print("%4d %6d  " % (k, count) + "  ".join("%12.2f" % ms for ms in row))
+    for name in names:
+        per_k, elapsed, sat_calls = results[name]
+        print("%s: %d MCSes, %.2f s, %d SAT calls" % (name, sum(count for count, _ in per_k.values()), elapsed, sat_calls))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+#
+# bench_result_codec.py -- Compare wire formats for results
+#
+# For random results of several sizes, compares:
+#   array:  the original format (a pickled array.array('i') of indexes)
+#   codec:  resultcodec.encode() (delta varints or a bitset, whichever is
+#           smaller), pickled the same way
+#   raw:    resultcodec.encode_raw() (the sorted indexes as native ints,
+#           used without NumPy unless sending over TCP), pickled the same way
+# reporting bytes per result and the time to encode+pickle and to
+# unpickle+decode each result.  (resultcodec uses NumPy for its bulk
+# conversions if it is installed, so compare runs with and without it.)
+#
+# Usage (from the tests/ directory):
+#   python3 benchmarks/bench_result_codec.py [n] [reps]
+#
+
+import array
+import os
+import pickle
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from src.marco import resultcodec  # noqa: E402
+
+
+def bench(label, results, encode, decode, reps):
+    msgs = [pickle.dumps(('S', encode(r)), pickle.HIGHEST_PROTOCOL) for r in results]
+    nbytes = sum(len(m) for m in msgs) / float(len(msgs))
+
+    start = time.time()
+    for _ in range(reps):
+        for r in results:
+            pickle.dumps(('S', encode(r)), pickle.HIGHEST_PROTOCOL)
+    enc_time = (time.time() - start) / (reps * len(results))
+
+    start = time.time()
+    for _ in range(reps):
+        for m in msgs:
+            decode(pickle.loads(m)[1])
+    dec_time = (time.time() - start) / (reps * len(results))
+
+    print("  %-6s %10.0f bytes  %9.1f us encode  %9.1f us decode" % (label, nbytes, enc_time * 1e6, dec_time * 1e6))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    reps = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    random.seed(1)
+    print("resultcodec using NumPy: %s" % (resultcodec.numpy is not None))
+
+    for size in [10, n // 100, n // 10, n // 2, n - n // 100]:
+        # sorted, as the solver library returns them
+        results = [array.array('i', sorted(random.sample(range(1, n+1), size))) for _ in range(20)]
+        print("n = %d, |result| = %d" % (n, size))
+        bench('array', results, lambda r: r, lambda r: r, reps)
+        bench('codec', results, lambda r: resultcodec.encode(r, n), resultcodec.decode, reps)
+        bench('raw', results, resultcodec.encode_raw, resultcodec.decode, reps)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+# bench_smallest.py -- Compare time-to-first-k smallest MUSes/MCSes with and without --smallest
+#
+# Runs MarcoPolo (in this process, single-threaded) on each instance, for
+# MUSes (-b MUSes) and for MCSes (-b MCSes), with:
+#   smallest:  --smallest K, seeds of minimum (maximum) size from a
+#              MinicardMapSolver, stopping after the K smallest results
+#   default:   the usual MinisatMapSolver, enumerating everything
+# reporting the time until each has found a set of K smallest results.  The
+# default run cannot know that it has until it has enumerated everything, so
+# its time to the K smallest is measured afterward (the earliest point at
+# which the results found so far included K smallest ones), and its total
+# time is reported as well.
+#
+# Usage (from the tests/ directory):
+#   python3 benchmarks/bench_smallest.py [K] [instance ...]
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from src.marco import marco, utils  # noqa: E402
+from src.marco.MarcoPolo import MarcoPolo  # noqa: E402
+
+
+def run(instance, bias, k=None):
+    '''Enumerate, returning the (time, size) of each MUS (MCS) found, and
+    the total time.  With k, stop after k of them (with --smallest k).'''
+    args_list = ['-b', bias, instance]
+    if k is not None:
+        args_list[:0] = ['--smallest', str(k)]
+    args = marco.parse_args(args_list)
+    stats = utils.Statistics()
+    csolver, msolver = marco.setup_solvers(args, seed=None, stats=stats)
+    enumerator = MarcoPolo(csolver, msolver, stats, marco.get_config(args))
+
+    found = []
+    start = time.time()
+    for result in enumerator.enumerate():
+        if bias == 'MUSes' and result[0] == 'U':
+            found.append((time.time() - start, len(result[1])))
+        elif bias == 'MCSes' and result[0] == 'S':
+            found.append((time.time() - start, csolver.n - len(result[1])))
+        if k is not None and len(found) == k:
+            break
+    return found, time.time() - start
+
+
+def time_to_smallest(found, k):
+    '''The earliest time at which the results found include k smallest
+    ones: every result smaller than the k-th smallest, and enough of that
+    size.'''
+    sizes = sorted(size for _, size in found)
+    if not sizes:
+        return float('nan')
+    k = min(k, len(sizes))
+    kth = sizes[k-1]
+    need_smaller = sum(1 for size in sizes if size < kth)
+    smaller = equal = 0
+    for elapsed, size in found:
+        if size < kth:
+            smaller += 1
+        elif size == kth:
+            equal += 1
+        if smaller == need_smaller and smaller + equal >= k:
+            return elapsed
+    assert False
+
+
+def main():
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    instances = sys.argv[2:] or ['c10.cnf', 'dlx2_aa.cnf']
+
+    print("k = %d" % k)
+    print("%-16s %6s  %14s  %14s  %14s" % ("instance", "type", "smallest (s)", "default (s)", "default total"))
+    for instance in instances:
+        for bias in ['MUSes', 'MCSes']:
+            smallest, _ = run(instance, bias, k)
+            default, total = run(instance, bias)
+            # the two runs must agree on the sizes of the k smallest
+            assert [size for _, size in smallest] == sorted(size for _, size in default)[:k]
+            print("%-16s %6s  %14.3f  %14.3f  %14.3f" % (instance, bias[:3], smallest[-1][0] if smallest else float('nan'), time_to_smallest(default, k), total))
+
+
+if __name__ == '__main__':
+    main()
@@ -72,7 +72,7 @@ jobs.extend([
     {
     'name':    'marco_py',
     'files':   reg_files,
-    'flags':   ['--comms-disable', '--comms-ignore', '--all-randomized', '--improved-implies'],
+    'flags':   ['--comms-disable', '--comms-ignore', '--all-randomized', '--improved-implies', '--cache', '--comms-batch 4', '--comms-log', '--backend threads', '--backend tcp', '--partition 2', '--adaptive 0.1', '--parallel MUS,MCSonly --mcs-strategy binary', '--parallel MUS,MCSonly --mcs-strategy core', '--smallest 1000000', '--smallest 1000000 -b MCSes', '--seed-batch 4', '--improved-implies --seed-batch 3', '--improved-implies --seed-batch 3 -b MCSes'],
     'flags_all': common_flags,
     'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
     'default': True,